@@ -1,7 +1,10 @@
-from flask import request, Blueprint
+from flask import current_app, request, Blueprint
 from dtos.book_ratings.post_book_rating_dto import PostBookRatingDto
 from dtos.book_recommenders.by_content_dto import ByContentDto
+from dtos.book_recommenders.by_contents_dto import ByContentsDto
 from dtos.book_recommenders.by_id_dto import ByIdDto
+from dtos.book_recommenders.by_ids_dto import ByIdsDto
+from dtos.books.image_variant_dto import ImageVariantDto
 from dtos.books.search_book_dto import SearchBookDto
 from dtos.converter import ValidationError
 from services.book_rating_service import BookRatingError, BookRatingService
@@ -9,7 +12,7 @@ from services.book_recommender_service import BookRecommenderError, BookRecommen
 from services.book_service import BookService
 from .api import api_blueprint
 from db import db
-from flask import jsonify
+from flask import jsonify, send_file
 from flask_login import login_required, current_user
 from csrf import csrf
 
@@ -18,6 +21,11 @@ books_blueprint = Blueprint('books', __name__,
 api_blueprint.register_blueprint(books_blueprint)
 
 
+def is_cache_stats_enabled() -> bool:
+    """Returns True if CACHE_STATS_ENABLED is set in app config, cache stats endpoints respond 404 otherwise."""
+    return current_app.config.get('CACHE_STATS_ENABLED', False)
+
+
 @books_blueprint.get("/search")
 def search():
     "Searches book by title."
@@ -64,6 +72,79 @@ def books_recommendations_by_content():
     return jsonify(list_with_json)
 
 
+@books_blueprint.post("/recommendations/batch")
+@csrf.exempt
+def books_recommendations_batch():
+    """
+    Gets recommendations for many books at once, body has either `ids` (list of book ids) or `contents` (list of content objects).
+    Returns a list where element i contains the recommendations of seed i.
+    """
+    user_id = current_user.id if current_user.is_authenticated else None
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return {"body": "* Body must be a JSON object!"}, 400
+    book_recommender_service = BookRecommenderService(db.session)
+    try:
+        if 'contents' in {k.lower() for k in body.keys()}:
+            dto = ByContentsDto.convert_from_dict(body, user_id)
+            dtos_per_seed = book_recommender_service.get_recommendations_by_contents(dto)
+        else:
+            dto = ByIdsDto.convert_from_dict(body, user_id)
+            dtos_per_seed = book_recommender_service.get_recommendations_by_ids(dto)
+    except ValidationError as err:
+        return err.to_tuple()
+    except BookRecommenderError as err:
+        return err.to_tuple()
+    list_with_json = [[dto.to_json() for dto in dtos] for dtos in dtos_per_seed]
+    return jsonify(list_with_json)
+
+
+@books_blueprint.get("/recommendations/cache_stats")
+@login_required
+def recommendations_cache_stats():
+    """Gets hit ratio, eviction and size counters of the recommendation cache, only if CACHE_STATS_ENABLED."""
+    if is_cache_stats_enabled() == False:
+        return {"cache_stats": "* Cache stats are disabled!"}, 404
+    book_recommender_service = BookRecommenderService(db.session)
+    dto = book_recommender_service.get_cache_stats()
+    return jsonify(dto.to_json())
+
+
+@books_blueprint.get("/<int:id>/image")
+def book_image(id: int):
+    """
+    Gets image of book, with ETag and Last-Modified headers and Cache-Control no-cache. The url doesn't change when the image
+    changes, therefore browsers revalidate it on every use with a conditional request and get 304 Not Modified if it didn't change.
+    Query arguments `variant` (w96, w192, w320 or placeholder) and `format` (webp or jpeg, default webp) request
+    a resized copy instead of the original image, if the copy can't be written the original image is sent and not stored.
+    """
+    try:
+        dto = ImageVariantDto.convert_from_dict(request.args, 'webp')
+    except ValidationError as err:
+        return err.to_tuple()
+    book_service = BookService(db.session)
+    filepath = book_service.find_image_path(id, dto)
+    if filepath is None:
+        return {"id": "* Book image doesn't exist!"}, 404
+    response = send_file(filepath.resolve(), conditional=True, etag=True)
+    if book_service.is_image_fallback(filepath, dto):
+        # the variant couldn't be written, browsers mustn't keep the original image under its url
+        response.cache_control.no_store = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+@books_blueprint.get("/images/cache_stats")
+@login_required
+def image_cache_stats():
+    """Gets hit ratio, byte usage and load counters of the cache of inline images, only if CACHE_STATS_ENABLED."""
+    if is_cache_stats_enabled() == False:
+        return {"cache_stats": "* Cache stats are disabled!"}, 404
+    book_service = BookService(db.session)
+    dto = book_service.get_image_cache_stats()
+    return jsonify(dto.to_json())
+
 
 @books_blueprint.post("/rate")
 @login_required
@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify
 from flask_login import login_required, current_user
 from db import db
-from dtos.book_recommenders.training_status_dto import TrainingStatus
+from dtos.book_recommenders.training_status_dto import TrainingStatus, TrainingStatusDto
 from services.book_recommender_service import BookRecommenderService
 from .api import api_blueprint
 
@@ -52,7 +52,18 @@ def train_logged_in_user():
         return res
 
     if validation_dto.training_status == TrainingStatus.CURRENTLY_TRAINING_LOGGED_IN_USER:
-        return book_recommender_service.get_training_progress(), {'content_type': 'Application/json'}
+        return book_recommender_service.get_training_progress(current_user.id), {'content_type': 'Application/json'}
 
-    book_recommender_service.train_on_single_user(current_user.id)
-    return book_recommender_service.get_training_progress(), {'content_type': 'Application/json'}
+    if book_recommender_service.train_on_single_user(current_user.id) == False:
+        # another request queued the user or filled the queue after validation
+        if book_recommender_service.is_training_scheduled(current_user.id):
+            dto = TrainingStatusDto(TrainingStatus.CURRENTLY_TRAINING_LOGGED_IN_USER, "Training is already queued!")
+            status_code = 409
+        else:
+            dto = TrainingStatusDto(TrainingStatus.CURRENTLY_TRAINING_OTHER_USER,
+                                    "Too many users are training. Please wait a few minutes!")
+            status_code = 503
+        res = jsonify(dto.to_json())
+        res.status_code = status_code
+        return res
+    return book_recommender_service.get_training_progress(current_user.id), {'content_type': 'Application/json'}
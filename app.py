@@ -5,5 +5,16 @@ app = Flask(__name__)
 #MODIFY LATER
 app.secret_key = "test"
 
+# if True, book dtos also contain their image encoded in base64 next to image_url, the current frontend reads it,
+# set to False once clients load image_url
+app.config['INLINE_BOOK_IMAGES'] = True
+# index of nearest neighbors searches, {'type': 'exact'} or an approximate inverted file index with tunable recall
+# {'type': 'ivf', 'n_lists': 256, 'n_probe': 8}, higher n_probe gives higher recall and slower searches,
+# see benchmark_nearest_neighbors.py
+app.config['NEIGHBOR_INDEX'] = {'type': 'exact'}
+# if True, cache counters are served to logged in users under /api/books/.../cache_stats, for debugging,
+# they reveal how often other users request books, keep False in production
+app.config['CACHE_STATS_ENABLED'] = False
+
 
 
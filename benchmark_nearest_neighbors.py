@@ -0,0 +1,74 @@
+import argparse
+import time
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+from vector_index import ExactCosineIndex, IvfCosineIndex
+
+# Compares recall and latency of vector_index against the brute force sklearn search
+# that NearestNeighborsRepository used before. Run from the project root:
+#   python benchmark_nearest_neighbors.py                 (item representations of the trained model)
+#   python benchmark_nearest_neighbors.py --synthetic 200000
+
+
+def load_item_representations() -> np.ndarray:
+    from services.lightfm_service import LightfmService
+    return LightfmService(None).get_item_representations()
+
+
+def recall(expected: np.ndarray, found: np.ndarray) -> float:
+    """Mean fraction of `expected` neighbors of each query that are in `found`."""
+    hits = [len(np.intersect1d(e, f)) / len(e) for e, f in zip(expected, found)]
+    return float(np.mean(hits))
+
+
+def time_queries(kneighbors, queries: np.ndarray) -> tuple[np.ndarray, float]:
+    """Searches every query on its own, like the by id endpoint, returns results and mean milliseconds per query."""
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(kneighbors(query.reshape(1, -1))[0])
+    elapsed = time.perf_counter() - start
+    return np.array(results), elapsed / len(queries) * 1000
+
+
+def benchmark(item_representations: np.ndarray, n_queries: int, n_neighbors: int, n_lists: int, n_probes: list[int]) -> None:
+    random_state = np.random.RandomState(0)
+    queries = item_representations[random_state.choice(
+        item_representations.shape[0], n_queries, replace=False)]
+
+    sklearn_model = NearestNeighbors(n_neighbors=n_neighbors, metric='cosine').fit(item_representations)
+    expected, sklearn_ms = time_queries(
+        lambda q: sklearn_model.kneighbors(q, return_distance=False), queries)
+    print(f"{'index':<28}{'fit s':>10}{'ms/query':>12}{'recall':>10}")
+    print(f"{'sklearn brute cosine':<28}{'':>10}{sklearn_ms:>12.3f}{1:>10.4f}")
+
+    indices = [('exact', ExactCosineIndex(n_neighbors=n_neighbors))]
+    indices += [(f'ivf lists={n_lists} probe={n_probe}', IvfCosineIndex(n_neighbors=n_neighbors, n_lists=n_lists, n_probe=n_probe))
+                for n_probe in n_probes]
+    for name, index in indices:
+        start = time.perf_counter()
+        index.fit(item_representations)
+        fit_s = time.perf_counter() - start
+        found, ms = time_queries(index.kneighbors, queries)
+        print(f"{name:<28}{fit_s:>10.2f}{ms:>12.3f}{recall(expected, found):>10.4f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='use this many random clustered vectors instead of the trained model')
+    parser.add_argument('--dim', type=int, default=201)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--neighbors', type=int, default=30)
+    parser.add_argument('--lists', type=int, default=256)
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    if args.synthetic > 0:
+        random_state = np.random.RandomState(0)
+        centers = random_state.randn(100, args.dim)
+        X = centers[random_state.randint(0, 100, args.synthetic)] + random_state.randn(args.synthetic, args.dim)
+        X = X.astype(np.float32)
+    else:
+        X = load_item_representations()
+    benchmark(X, args.queries, args.neighbors, args.lists, args.probes)
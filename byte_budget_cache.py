@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from threading import Event, Lock
+from typing import Any, Callable, Hashable
+
+
+class _PendingLoad:
+    """Load of a missing key, threads that miss the same key while it runs wait for its result."""
+
+    def __init__(self):
+        self.done = Event()
+        self.value: Any | None = None
+        self.error: BaseException | None = None
+
+
+class ByteBudgetLruCache:
+    """
+    Thread safe cache whose entries take at most `max_bytes` in total, evicting the least recently used ones.
+    Size of an entry is `get_size(value)`, values larger than `max_bytes` aren't cached.
+    Misses of the same key at the same time run a single load, see `get_or_load`.
+    """
+
+    def __init__(self, max_bytes: int, get_size: Callable[[Any], int] = len):
+        self.max_bytes = max_bytes
+        self.get_size = get_size
+        # key -> (size, value), ordered from least to most recently used
+        self.__entries: OrderedDict = OrderedDict()
+        self.__pending_loads: dict[Hashable, _PendingLoad] = {}
+        self.__bytes = 0
+        self.__lock = Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__loads = 0
+        self.__shared_loads = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        """
+        Gets value by `key` and marks it as most recently used.
+
+        Args:
+            key (Hashable): Key.
+
+        Returns:
+            Any | None: None if `key` is missing.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return entry[1]
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any | None]) -> Any | None:
+        """
+        Gets value by `key`, if it is missing calls `load` and caches its result unless it is None.
+        If another thread is already loading `key`, waits for its result instead of calling `load`.
+
+        Args:
+            key (Hashable): Key.
+            load (Callable[[], Any | None]): Computes the value of `key`, called without holding the cache lock.
+
+        Returns:
+            Any | None: None if `load` returned None.
+
+        Raises:
+            Exception: Error raised by `load`, in every thread waiting for it.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+                self.__hits += 1
+                return entry[1]
+            self.__misses += 1
+            pending_load = self.__pending_loads.get(key)
+            is_loading = pending_load is None
+            if is_loading:
+                pending_load = _PendingLoad()
+                self.__pending_loads[key] = pending_load
+                self.__loads += 1
+            else:
+                self.__shared_loads += 1
+
+        if is_loading:
+            try:
+                pending_load.value = load()
+            except BaseException as err:
+                pending_load.error = err
+            with self.__lock:
+                del self.__pending_loads[key]
+                if pending_load.error is None and pending_load.value is not None:
+                    self.__set(key, pending_load.value)
+            pending_load.done.set()
+        else:
+            pending_load.done.wait()
+
+        if pending_load.error is not None:
+            raise pending_load.error
+        return pending_load.value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Sets `value` by `key`, evicts least recently used entries until entries fit in `max_bytes`.
+
+        Args:
+            key (Hashable): Key.
+            value (Any): Value to cache.
+
+        Returns:
+            None.
+        """
+        with self.__lock:
+            self.__set(key, value)
+
+    def delete(self, key: Hashable) -> None:
+        """Deletes `key` if it exists."""
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is not None:
+                self.__bytes -= entry[0]
+
+    def clear(self) -> None:
+        """Deletes all entries, counters are kept."""
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def get_stats(self) -> dict:
+        """
+        Gets cache counters.
+
+        Returns:
+            dict: Keys are size, bytes, max_bytes, hits, misses, hit_ratio, evictions, loads and shared_loads.
+            shared_loads counts misses that waited for the load of another thread.
+        """
+        with self.__lock:
+            lookups = self.__hits + self.__misses
+            return {
+                'size': len(self.__entries),
+                'bytes': self.__bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'hit_ratio': self.__hits / lookups if lookups > 0 else 0.0,
+                'evictions': self.__evictions,
+                'loads': self.__loads,
+                'shared_loads': self.__shared_loads
+            }
+
+    def __set(self, key: Hashable, value: Any) -> None:
+        """Sets `value` by `key`, must be called while holding the lock."""
+        size = self.get_size(value)
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            self.__bytes -= entry[0]
+        if size > self.max_bytes:
+            return
+        self.__entries[key] = (size, value)
+        self.__bytes += size
+        while self.__bytes > self.max_bytes:
+            _, (evicted_size, _) = self.__entries.popitem(last=False)
+            self.__bytes -= evicted_size
+            self.__evictions += 1
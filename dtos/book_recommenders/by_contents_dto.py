@@ -0,0 +1,37 @@
+from dtos.book_recommenders.by_content_dto import ByContentDto
+from dtos.converter import Converter, ValidationError
+
+
+class ByContentsDto:
+
+    MAX_CONTENTS = 100
+
+    def __init__(self, contents: list[ByContentDto], user_id: int | None = None):
+        self.contents = contents
+        self.user_id = user_id
+
+    @staticmethod
+    def convert_from_dict(body: dict, user_id: int | None = None) -> "ByContentsDto":
+        """
+        Converts dict to ByContentsDto.
+
+        Args:
+            body (dict): Dictionary to be converted.
+
+        Returns:
+            ByContentsDto.
+
+        Raises:
+            ValidationError: If any validation fails.
+        """
+        body = {k.lower(): v for k, v in body.items()}
+        Converter.validate_is_required(body, 'contents')
+        Converter.validate_is_list(body, 'contents')
+        Converter.validate_list_len_is_in_range(
+            body, 'contents', 1, ByContentsDto.MAX_CONTENTS)
+        if any(type(v) is not dict for v in body['contents']):
+            raise ValidationError(
+                {'contents': "* Contents must be a list of objects!"}, 400)
+        contents = [ByContentDto.convert_from_dict(
+            v, user_id) for v in body['contents']]
+        return ByContentsDto(contents, user_id)
@@ -0,0 +1,51 @@
+from dtos.converter import Converter, ValidationError
+
+
+class ByIdsDto:
+
+    MAX_IDS = 100
+
+    def __init__(self, ids: list[int], user_id: int | None = None):
+        self.book_ids = ids
+        self.user_id = user_id
+
+    @staticmethod
+    def convert_from_dict(body: dict, user_id: int | None = None) -> "ByIdsDto":
+        """
+        Converts dict to ByIdsDto.
+
+        Args:
+            body (dict): Dictionary to be converted.
+
+        Returns:
+            ByIdsDto.
+
+        Raises:
+            ValidationError: If any validation fails.
+        """
+        body = {k.lower(): v for k, v in body.items()}
+        Converter.validate_is_required(body, 'ids')
+        Converter.validate_is_list(body, 'ids')
+        Converter.validate_list_len_is_in_range(
+            body, 'ids', 1, ByIdsDto.MAX_IDS)
+        ids = [ByIdsDto.__convert_id(v, i) for i, v in enumerate(body['ids'])]
+        return ByIdsDto(ids, user_id)
+
+    @staticmethod
+    def __convert_id(value, index: int) -> int:
+        """
+        Converts id at `index` of ids to int, like ByIdDto only integers and strings of integers are valid,
+        floats and bools are rejected instead of truncated.
+
+        Raises:
+            ValidationError: If `value` isn't an integer.
+        """
+        if type(value) is int:
+            return value
+        if type(value) is str:
+            try:
+                return int(value)
+            except ValueError:
+                pass
+        raise ValidationError(
+            {'ids': f"* Id at index {index} must be an integer!"}, 400)
@@ -0,0 +1,27 @@
+class CacheStatsDto:
+    def __init__(self,
+                 size: int,
+                 max_size: int,
+                 hits: int,
+                 misses: int,
+                 hit_ratio: float,
+                 evictions: int,
+                 expirations: int):
+        self.size = size
+        self.max_size = max_size
+        self.hits = hits
+        self.misses = misses
+        self.hit_ratio = hit_ratio
+        self.evictions = evictions
+        self.expirations = expirations
+
+    def to_json(self):
+        return {
+            "size": self.size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
@@ -4,7 +4,8 @@ class GetBookDto:
                  title: str,
                  description: str,
                  link: str,
-                 image: str,
+                 image: str | None,
+                 image_url: str | None,
                  nr_likes: int,
                  nr_dislikes: int,
                  categories: list[str],
@@ -15,6 +16,7 @@ class GetBookDto:
         self.description = description
         self.link = link
         self.image = image
+        self.image_url = image_url
         self.nr_likes = nr_likes
         self.nr_dislikes = nr_dislikes
         self.categories = categories
@@ -28,6 +30,7 @@ class GetBookDto:
             "description": self.description,
             "link": self.link,
             "image": self.image,
+            "image_url": self.image_url,
             "nr_likes": self.nr_likes,
             "nr_dislikes": self.nr_dislikes,
             "categories": self.categories,
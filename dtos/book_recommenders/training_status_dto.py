@@ -10,6 +10,14 @@ class TrainingStatus(Enum):
     CURRENTLY_TRAINING_LOGGED_IN_USER = 5
 
 
+class TrainingProgressStatus(Enum):
+    QUEUED = 0
+    TRAINING = 1
+    FINISHED = 2
+    BUDGET_EXHAUSTED = 3
+    PLATEAU = 4
+
+
 class TrainingStatusDto:
     def __init__(self, training_status: TrainingStatus, message : str):
         self.training_status = training_status
@@ -0,0 +1,33 @@
+class ImageCacheStatsDto:
+    def __init__(self,
+                 size: int,
+                 bytes: int,
+                 max_bytes: int,
+                 hits: int,
+                 misses: int,
+                 hit_ratio: float,
+                 evictions: int,
+                 loads: int,
+                 shared_loads: int):
+        self.size = size
+        self.bytes = bytes
+        self.max_bytes = max_bytes
+        self.hits = hits
+        self.misses = misses
+        self.hit_ratio = hit_ratio
+        self.evictions = evictions
+        self.loads = loads
+        self.shared_loads = shared_loads
+
+    def to_json(self):
+        return {
+            "size": self.size,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+            "evictions": self.evictions,
+            "loads": self.loads,
+            "shared_loads": self.shared_loads
+        }
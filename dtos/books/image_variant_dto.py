@@ -0,0 +1,35 @@
+from dtos.converter import Converter
+import image_variants
+
+
+class ImageVariantDto:
+    def __init__(self, variant: str | None, format: str):
+        self.variant = variant
+        self.format = format
+
+    @staticmethod
+    def convert_from_dict(body: dict, default_format: str) -> "ImageVariantDto":
+        """
+        Converts dict to ImageVariantDto.
+
+        Args:
+            body (dict): Dictionary to be converted.
+            default_format (str): Default if format not in `body`.
+
+        Returns:
+            ImageVariantDto: variant is None if not in `body`, the original image is requested.
+
+        Raises:
+            ValidationError: If any validation fails.
+        """
+        variant = None
+        if 'variant' in body:
+            Converter.validate_has_value_in_list(
+                body, 'variant', set(image_variants.VARIANT_WIDTHS))
+            variant = body['variant']
+        format = default_format
+        if 'format' in body:
+            Converter.validate_has_value_in_list(
+                body, 'format', set(image_variants.VARIANT_FORMATS))
+            format = body['format']
+        return ImageVariantDto(variant, format)
@@ -204,4 +204,25 @@ class Converter:
         if type(body[key]) is not list:
             cap_key = HelperMethods.capitalize_first_letter(key)
             raise ValidationError(
-                {key: f"{cap_key} must be a list!"}, 400)
\ No newline at end of file
+                {key: f"{cap_key} must be a list!"}, 400)
+
+    @staticmethod
+    def validate_list_len_is_in_range(body: dict, key: str, min_inclusive, max_inclusive) -> None:
+        """
+        Checks if `body[key]` list is in `min_inclusive` - `max_inclusive` length range.
+
+        Args:
+            body (dict): Dictionary that contains `key`.
+            key (str): Key to access value in `body`.
+
+        Returns:
+            None.
+
+        Raises:
+            ValidationError: If length of list is not in `min_inclusive` - `max_inclusive` length range.
+        """
+        length = len(body[key])
+        if length < min_inclusive or length > max_inclusive:
+            cap_key = HelperMethods.capitalize_first_letter(key)
+            raise ValidationError(
+                {key: f"* {cap_key} must have between {min_inclusive} and {max_inclusive} values!"}, 400)
\ No newline at end of file
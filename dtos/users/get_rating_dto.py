@@ -3,7 +3,8 @@ class GetRatingDto:
                  book_id: str,
                  title: str,
                  rating: str,
-                 image: str,
+                 image: str | None,
+                 image_url: str | None,
                  link: str,
                  nr_likes: int,
                  nr_dislikes: int):
@@ -11,6 +12,7 @@ class GetRatingDto:
         self.title = title
         self.rating = rating
         self.image = image
+        self.image_url = image_url
         self.link = link
         self.nr_likes = nr_likes
         self.nr_dislikes = nr_dislikes
@@ -21,6 +23,7 @@ class GetRatingDto:
             "title": self.title,
             "rating": self.rating,
             "image": self.image,
+            "image_url": self.image_url,
             "link": self.link,
             "nr_likes": self.nr_likes,
             "nr_dislikes": self.nr_dislikes
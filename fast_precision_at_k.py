@@ -0,0 +1,90 @@
+from typing import Callable
+import numpy as np
+from scipy.stats import norm
+
+# Precision at k of a single user computed from its scores, same result as custom_precision_at_k without train interactions
+# but without predict_rank. The rank of a positive item is the number of items with a strictly higher score,
+# a positive item is a hit if its rank is lower than k.
+
+
+class PrecisionEstimate:
+    def __init__(self, precision: float, lower: float, upper: float):
+        self.precision = precision
+        self.lower = lower
+        self.upper = upper
+
+
+def precision_at_k(scores: np.ndarray, positive_ids: np.ndarray | list[int], k: int | None = None) -> float:
+    """
+    Computes precision at k from the scores of all items with a single partition.
+
+    Args:
+        scores (np.ndarray): Single dimensional array, score of each item.
+        positive_ids (np.ndarray | list[int]): Items the user interacted with.
+        k (int | None): Number of top items, number of positive items if None.
+
+    Returns:
+        float: Hits divided by min(k, number of positive items), like custom_precision_at_k.
+    """
+    positive_ids = np.asarray(positive_ids)
+    k = len(positive_ids) if k is None else k
+    k = min(k, scores.shape[0])
+    if k <= 0 or len(positive_ids) == 0:
+        return 0.0
+    # rank of an item is lower than k exactly when its score is at least the k-th highest score
+    kth_score = np.partition(scores, scores.shape[0] - k)[scores.shape[0] - k]
+    nr_hits = np.count_nonzero(scores[positive_ids] >= kth_score)
+    return nr_hits / min(k, len(positive_ids))
+
+
+def sampled_precision_at_k(score_items: Callable[[np.ndarray], np.ndarray], nr_items: int,
+                           positive_ids: np.ndarray | list[int], k: int | None = None, nr_samples: int = 1000,
+                           confidence_level: float = 0.95, random_state: np.random.RandomState | None = None) -> PrecisionEstimate:
+    """
+    Estimates precision at k by scoring only the positive items and `nr_samples` sampled negative items.
+    The number of negative items above each positive item is estimated from the sampled ones with a Wilson interval,
+    a positive item is certainly a hit if the upper bound of its rank is lower than k and possibly a hit if the lower bound is.
+
+    Args:
+        score_items (Callable[[np.ndarray], np.ndarray]): Returns the scores of the items with the given ids.
+        nr_items (int): Number of items.
+        positive_ids (np.ndarray | list[int]): Items the user interacted with.
+        k (int | None): Number of top items, number of positive items if None.
+        nr_samples (int): Number of negative items to score, sampled with replacement.
+        confidence_level (float): Confidence level of the rank interval of each positive item.
+        random_state (np.random.RandomState | None): Random state used for sampling.
+
+    Returns:
+        PrecisionEstimate: Point estimate and interval.
+    """
+    positive_ids = np.asarray(positive_ids)
+    k = len(positive_ids) if k is None else k
+    k = min(k, nr_items)
+    if k <= 0 or len(positive_ids) == 0:
+        return PrecisionEstimate(0.0, 0.0, 0.0)
+    random_state = np.random.RandomState() if random_state is None else random_state
+
+    is_positive = np.zeros(nr_items, dtype=bool)
+    is_positive[positive_ids] = True
+    nr_negatives = nr_items - is_positive.sum()
+    samples = random_state.randint(0, nr_items, nr_samples)
+    samples = samples[is_positive[samples] == False]
+
+    positive_scores = score_items(positive_ids)
+    sample_scores = np.sort(score_items(samples))
+    nr_positives_above = np.sum(positive_scores[None, :] > positive_scores[:, None], axis=1)
+    nr_samples_above = sample_scores.shape[0] - np.searchsorted(sample_scores, positive_scores, side='right')
+
+    nr_sampled = max(sample_scores.shape[0], 1)
+    fraction = nr_samples_above / nr_sampled
+    z = norm.ppf(0.5 + confidence_level / 2)
+    center = (fraction + z ** 2 / (2 * nr_sampled)) / (1 + z ** 2 / nr_sampled)
+    margin = z * np.sqrt(fraction * (1 - fraction) / nr_sampled + z ** 2 / (4 * nr_sampled ** 2)) / (1 + z ** 2 / nr_sampled)
+
+    ranks = nr_positives_above + fraction * nr_negatives
+    lower_ranks = nr_positives_above + np.maximum(center - margin, 0) * nr_negatives
+    upper_ranks = nr_positives_above + np.minimum(center + margin, 1) * nr_negatives
+    denominator = min(k, len(positive_ids))
+    return PrecisionEstimate(np.count_nonzero(ranks < k) / denominator,
+                             np.count_nonzero(upper_ranks < k) / denominator,
+                             np.count_nonzero(lower_ranks < k) / denominator)
@@ -0,0 +1,55 @@
+import numpy as np
+
+
+class GrowableArray:
+    """
+    Array whose first axis grows by appending rows to a buffer with spare capacity, the capacity doubles when it is full,
+    therefore appending a row is amortized O(1). `view` returns the active prefix of the buffer without copying.
+
+    Views returned before an append stay valid, they don't include the appended rows. After the buffer is reallocated,
+    previous views keep the old buffer, writes to rows of the new view aren't visible in them.
+    """
+
+    def __init__(self, array: np.ndarray, min_capacity: int = 1024):
+        """
+        Args:
+            array (np.ndarray): Initial rows, copied into the buffer.
+            min_capacity (int): Minimum number of rows of the buffer.
+        """
+        self.__size = array.shape[0]
+        self.__buffer = np.empty(
+            (max(min_capacity, 2 * self.__size),) + array.shape[1:], dtype=array.dtype)
+        self.__buffer[:self.__size] = array
+
+    def view(self) -> np.ndarray:
+        """Gets the active rows, C contiguous view of the buffer."""
+        return self.__buffer[:self.__size]
+
+    def is_view(self, array: np.ndarray) -> bool:
+        """Returns True if `array` is the current `view`, False for views returned before the last append."""
+        return array.base is self.__buffer and array.shape[0] == self.__size and \
+            array.__array_interface__['data'][0] == self.__buffer.__array_interface__['data'][0]
+
+    def get_capacity(self) -> int:
+        """Gets number of rows of the buffer."""
+        return self.__buffer.shape[0]
+
+    def append(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Appends `rows` after the active rows, reallocates the buffer with double capacity if they don't fit.
+
+        Args:
+            rows (np.ndarray): Rows with the same shape as the other rows, except the first axis, cast to the dtype of the buffer.
+
+        Returns:
+            np.ndarray: The new `view`.
+        """
+        new_size = self.__size + rows.shape[0]
+        if new_size > self.__buffer.shape[0]:
+            buffer = np.empty(
+                (max(2 * self.__buffer.shape[0], new_size),) + self.__buffer.shape[1:], dtype=self.__buffer.dtype)
+            buffer[:self.__size] = self.__buffer[:self.__size]
+            self.__buffer = buffer
+        self.__buffer[self.__size:new_size] = rows
+        self.__size = new_size
+        return self.view()
@@ -0,0 +1,162 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import logging
+import os
+from pathlib import Path
+import threading
+from PIL import Image
+from thread_budget import ThreadBudget
+import utils
+
+logger = logging.getLogger(__name__)
+
+# Resized copies of book covers in books_data/images, written to books_data/image_variants/<variant>/<cover filename>.<format>.
+# Variants are generated for every cover by running this module from the project root, covers added or changed later
+# are generated again on the next run or on the first request of the variant, see find_up_to_date_variant_path:
+#   python image_variants.py --workers 8
+
+# variant name -> width in pixels, height keeps the aspect ratio, covers narrower than the width aren't enlarged
+VARIANT_WIDTHS = {'w96': 96, 'w192': 192, 'w320': 320, 'placeholder': 16}
+# format name -> (Pillow format, file extension)
+VARIANT_FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg')}
+QUALITY = 80
+# placeholder is shown blurred while the cover loads, therefore its quality hardly matters
+PLACEHOLDER_QUALITY = 30
+# variants missing on request are written by at most this many threads, other requests wait, decoding a large cover takes
+# memory and cpu that would otherwise be taken by every request at the same time
+ON_DEMAND_MAX_WORKERS = 2
+# errors of Pillow for covers it can't decode, UnidentifiedImageError is an OSError
+IMAGE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+_on_demand_executor = ThreadPoolExecutor(max_workers=ON_DEMAND_MAX_WORKERS, thread_name_prefix='image_variants')
+
+
+def get_variant_path(filename: str | Path, variant: str, format: str) -> Path:
+    """
+    Gets path of `variant` in `format` of cover `filename`, the file may not exist.
+
+    Args:
+        filename (str | Path): Cover filename in books_data/images.
+        variant (str): Key of VARIANT_WIDTHS.
+        format (str): Key of VARIANT_FORMATS.
+
+    Returns:
+        Path.
+    """
+    extension = VARIANT_FORMATS[format][1]
+    # the whole cover filename is kept, covers with the same name and different extensions don't share variants
+    return utils.BOOKS_DATA_IMAGE_VARIANTS / variant / f'{Path(filename).name}.{extension}'
+
+
+def is_variant_path(path: Path) -> bool:
+    """Returns True if `path` is in books_data/image_variants, False for a cover in books_data/images."""
+    return utils.BOOKS_DATA_IMAGE_VARIANTS.resolve() in path.resolve().parents
+
+
+def is_variant_up_to_date(source_path: Path, variant_path: Path) -> bool:
+    """Returns True if `variant_path` exists and wasn't modified before `source_path`."""
+    return variant_path.is_file() and variant_path.stat().st_mtime >= source_path.stat().st_mtime
+
+
+def generate_variants(filename: str | Path) -> int:
+    """
+    Writes every variant in every format of cover `filename` that is missing or older than the cover.
+
+    Args:
+        filename (str | Path): Cover filename in books_data/images.
+
+    Returns:
+        int: Number of written files, 0 if the cover can't be decoded.
+    """
+    source_path = utils.BOOKS_DATA_IMAGES / filename
+    outdated = [(variant, format) for variant in VARIANT_WIDTHS for format in VARIANT_FORMATS
+                if not is_variant_up_to_date(source_path, get_variant_path(filename, variant, format))]
+    if len(outdated) == 0:
+        return 0
+    # the cover is decoded once for all its variants
+    try:
+        with Image.open(source_path) as image:
+            image = image.convert('RGB')
+            for variant, format in outdated:
+                _write_variant(image, get_variant_path(filename, variant, format), variant, format)
+    except IMAGE_ERRORS:
+        # a single broken cover doesn't stop the other covers
+        logger.exception('Variants of cover %s could not be written', source_path)
+        return 0
+    return len(outdated)
+
+
+def find_up_to_date_variant_path(filename: str | Path, variant: str, format: str) -> Path | None:
+    """
+    Gets path of `variant` in `format` of cover `filename`, writes the variant first if it is missing or older than the cover.
+    Variants are written by a bounded pool, see ON_DEMAND_MAX_WORKERS. If the cover can't be decoded, its path is returned
+    instead, the variant is tried again on the next request.
+
+    Args:
+        filename (str | Path): Cover filename in books_data/images.
+        variant (str): Key of VARIANT_WIDTHS.
+        format (str): Key of VARIANT_FORMATS.
+
+    Returns:
+        Path | None: None if the cover doesn't exist.
+    """
+    source_path = utils.BOOKS_DATA_IMAGES / filename
+    if not source_path.is_file():
+        return None
+    variant_path = get_variant_path(filename, variant, format)
+    if is_variant_up_to_date(source_path, variant_path):
+        return variant_path
+    try:
+        _on_demand_executor.submit(_write_variant_of_cover, source_path, variant_path, variant, format).result()
+    except IMAGE_ERRORS:
+        logger.exception('Variant %s %s of cover %s could not be written', variant, format, source_path)
+        return source_path
+    return variant_path
+
+
+def generate_all_variants(max_workers: int, chunksize: int = 64) -> int:
+    """
+    Writes missing and outdated variants of every cover in books_data/images, covers are split across a process pool.
+
+    Args:
+        max_workers (int): Number of processes.
+        chunksize (int): Number of covers sent to a process at once.
+
+    Returns:
+        int: Number of written files.
+    """
+    filenames = [entry.name for entry in os.scandir(utils.BOOKS_DATA_IMAGES) if entry.is_file()]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return sum(executor.map(generate_variants, filenames, chunksize=chunksize))
+
+
+def _write_variant_of_cover(source_path: Path, variant_path: Path, variant: str, format: str) -> None:
+    """Decodes the cover at `source_path` and writes its `variant` in `format` to `variant_path`."""
+    with Image.open(source_path) as image:
+        _write_variant(image.convert('RGB'), variant_path, variant, format)
+
+
+def _write_variant(image: Image.Image, variant_path: Path, variant: str, format: str) -> None:
+    """Resizes `image` to the width of `variant` and writes it to `variant_path` in `format`, replacing the file atomically."""
+    width = min(VARIANT_WIDTHS[variant], image.width)
+    height = max(1, round(image.height * width / image.width))
+    resized = image.resize((width, height), Image.Resampling.LANCZOS)
+    quality = PLACEHOLDER_QUALITY if variant == 'placeholder' else QUALITY
+    os.makedirs(variant_path.parent, exist_ok=True)
+    # readers never see a partially written file, concurrent writers of the same variant each write their own temporary file
+    tmp_path = variant_path.with_name(
+        f'{variant_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        resized.save(tmp_path, format=VARIANT_FORMATS[format][0], quality=quality)
+        os.replace(tmp_path, variant_path)
+    finally:
+        # exists only if save or replace failed
+        tmp_path.unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=ThreadBudget.get_available_cores())
+    args = parser.parse_args()
+    nr_written = generate_all_variants(args.workers)
+    print(f'{nr_written} variants written')
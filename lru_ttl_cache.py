@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+
+
+class LruTtlCache:
+    """
+    Thread safe cache that holds at most `max_size` entries, evicting the least recently used one,
+    and where each entry expires `ttl` seconds after it was set.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (expiration time, value), ordered from least to most recently used
+        self.__entries: OrderedDict = OrderedDict()
+        self.__lock = Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__expirations = 0
+
+    def get(self, key) -> object | None:
+        """
+        Gets value by `key` and marks it as most recently used.
+
+        Args:
+            key: Hashable key.
+
+        Returns:
+            object | None: None if `key` is missing or expired.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.__misses += 1
+                return None
+            expiration, value = entry
+            if expiration <= time.monotonic():
+                del self.__entries[key]
+                self.__expirations += 1
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return value
+
+    def set(self, key, value) -> None:
+        """
+        Sets `value` by `key`, evicts least recently used entries if cache is full.
+
+        Args:
+            key: Hashable key.
+            value: Value to cache.
+
+        Returns:
+            None.
+        """
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + self.ttl, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.__evictions += 1
+
+    def delete(self, key) -> None:
+        """Deletes `key` if it exists."""
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Deletes all entries, counters are kept."""
+        with self.__lock:
+            self.__entries.clear()
+
+    def get_stats(self) -> dict:
+        """
+        Gets cache counters.
+
+        Returns:
+            dict: Keys are size, max_size, hits, misses, hit_ratio, evictions and expirations.
+        """
+        with self.__lock:
+            lookups = self.__hits + self.__misses
+            return {
+                'size': len(self.__entries),
+                'max_size': self.max_size,
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'hit_ratio': self.__hits / lookups if lookups > 0 else 0.0,
+                'evictions': self.__evictions,
+                'expirations': self.__expirations
+            }
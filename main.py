@@ -3,10 +3,12 @@ from app import app
 import api
 from cors import init_cors
 from db import db
+from services.lightfm_service import LightfmService
 from services.nearest_neighbors_service import NearestNeighborsService
 from session import init_session
 from csrf import csrf
 from login_manager import login_manager
+from thread_budget import thread_budget
 import logging
 
 #logging.basicConfig()
@@ -19,5 +21,9 @@ if __name__ == '__main__':
     init_session(app)
     csrf.init_app(app)
     login_manager.init_app(app)
-    NearestNeighborsService(None).refit_neighbors()
+    thread_budget.apply_blas_limit()
+    LightfmService(None).check_user_rows_match_features()
+    nearest_neighbors_service = NearestNeighborsService(None)
+    nearest_neighbors_service.refit_neighbors()
+    nearest_neighbors_service.rebuild_neighbor_table_in_background()
     app.run(debug=True, threaded=True)
\ No newline at end of file
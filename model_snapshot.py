@@ -0,0 +1,109 @@
+from threading import Lock
+import numpy as np
+from lightfm import LightFM
+from vector_index import ExactCosineIndex, IvfCosineIndex
+
+
+class ModelSnapshot:
+    """
+    Model state that recommendations are computed from: the LightFM model, the item representation matrix and the
+    nearest neighbors index built from it. A snapshot is never changed after it is published, training publishes a new one
+    and readers keep using the snapshot they started with.
+
+    Item arrays, item representations and the index are never modified. User arrays are shared with the next snapshots
+    and rows of a trained user are written in place, copying them for every training would cost O(number of users).
+
+    Item representations, their Gram matrix and the index can be missing when the snapshot is created, the first one to compute
+    them sets them once.
+
+    `version` changes with every published training, `item_version` only when item arrays changed, it is the version
+    of the snapshot that changed them. Results that only depend on items, like neighbors of a book, are keyed by `item_version`.
+    """
+
+    def __init__(self, model: LightFM, version: int, item_representations: np.ndarray | None = None,
+                 index: ExactCosineIndex | IvfCosineIndex | None = None, item_version: int | None = None):
+        self.model = model
+        self.version = version
+        self.item_version = version if item_version is None else item_version
+        self.__item_representations = item_representations
+        self.__index = index
+        self.__item_gram: np.ndarray | None = None
+        self.__lock = Lock()
+        if item_representations is not None:
+            item_representations.setflags(write=False)
+
+    def get_item_representations(self) -> np.ndarray | None:
+        """Gets read only item representations or None if they weren't computed."""
+        return self.__item_representations
+
+    def set_item_representations_if_missing(self, item_representations: np.ndarray) -> np.ndarray:
+        """
+        Sets item representations if they weren't set.
+
+        Args:
+            item_representations (np.ndarray): Two dimensional array, row i belongs to book with id i.
+
+        Returns:
+            np.ndarray: Item representations of this snapshot, the ones set first.
+        """
+        with self.__lock:
+            if self.__item_representations is None:
+                item_representations.setflags(write=False)
+                self.__item_representations = item_representations
+            return self.__item_representations
+
+    def derive_with_same_items(self, model: LightFM, version: int) -> "ModelSnapshot":
+        """
+        Creates a snapshot of `model`, whose item arrays must be the ones of this snapshot, therefore the new snapshot
+        reuses item representations, their Gram matrix, the index and the item version.
+
+        Args:
+            model (LightFM): Model with changed user arrays.
+            version (int): Version of the new snapshot.
+
+        Returns:
+            ModelSnapshot.
+        """
+        snapshot = ModelSnapshot(model, version, self.__item_representations,
+                                 self.__index, self.item_version)
+        snapshot.__item_gram = self.__item_gram
+        return snapshot
+
+    def get_item_gram(self) -> np.ndarray | None:
+        """Gets read only Gram matrix of item representations with the bias column replaced by ones, None if it wasn't computed."""
+        return self.__item_gram
+
+    def set_item_gram_if_missing(self, item_gram: np.ndarray) -> np.ndarray:
+        """
+        Sets Gram matrix of item representations if it wasn't set.
+
+        Args:
+            item_gram (np.ndarray): Two dimensional square array.
+
+        Returns:
+            np.ndarray: Gram matrix of this snapshot, the one set first.
+        """
+        with self.__lock:
+            if self.__item_gram is None:
+                item_gram.setflags(write=False)
+                self.__item_gram = item_gram
+            return self.__item_gram
+
+    def get_index(self) -> ExactCosineIndex | IvfCosineIndex | None:
+        """Gets nearest neighbors index or None if it wasn't built."""
+        return self.__index
+
+    def set_index_if_missing(self, index: ExactCosineIndex | IvfCosineIndex) -> ExactCosineIndex | IvfCosineIndex:
+        """
+        Sets nearest neighbors index if it wasn't set.
+
+        Args:
+            index (ExactCosineIndex | IvfCosineIndex): Index built from item representations of this snapshot.
+
+        Returns:
+            ExactCosineIndex | IvfCosineIndex: Index of this snapshot, the one set first.
+        """
+        with self.__lock:
+            if self.__index is None:
+                self.__index = index
+            return self.__index
@@ -0,0 +1,224 @@
+import json
+import os
+from pathlib import Path
+import shutil
+import joblib
+import numpy as np
+from lightfm import LightFM
+
+# Stores a LightFM model as a directory with one .npy file for each array and a manifest.
+# Arrays are loaded with np.load(mmap_mode=...) so processes share page cache pages instead of each one
+# unpickling the whole model in private memory.
+# Changes after the snapshot are appended to a delta log, a directory of numbered .npz files, each one holding
+# the changed rows of model arrays. Loading replays deltas newer than the snapshot onto it.
+# User arrays stay memory mapped only until the first user is added: LightfmRepository grows them in GrowableArray buffers
+# in private memory, therefore from then on each process holds its own copy of the user arrays (users x components floats
+# for each of the 6 user arrays) until it restarts. Item arrays, the largest part of the model, are never grown and stay shared.
+
+MANIFEST_FILE = 'manifest.json'
+RANDOM_STATE_FILE = 'random_state.pkl'
+FORMAT_VERSION = 1
+DELTA_PREFIX = 'delta_'
+
+MODEL_ARRAYS = ['item_embeddings', 'item_embedding_gradients', 'item_embedding_momentum',
+                'item_biases', 'item_bias_gradients', 'item_bias_momentum',
+                'user_embeddings', 'user_embedding_gradients', 'user_embedding_momentum',
+                'user_biases', 'user_bias_gradients', 'user_bias_momentum']
+
+
+def save_model_arrays(model: LightFM, directory: str | Path, last_delta_sequence: int = 0) -> None:
+    """
+    Saves `model` arrays, params and random state to `directory`. Files are written to a temporary directory
+    that replaces `directory` at the end, therefore arrays memory mapped from `directory` can be saved.
+
+    Args:
+        model (LightFM): Fitted model.
+        directory (str | Path): Directory to save to.
+        last_delta_sequence (int): Sequence of the last delta already contained by `model`.
+
+    Returns:
+        None.
+    """
+    directory = Path(directory)
+    tmp_directory = directory.with_name(directory.name + '.tmp')
+    old_directory = directory.with_name(directory.name + '.old')
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    arrays = {}
+    for name in MODEL_ARRAYS:
+        array = np.ascontiguousarray(getattr(model, name))
+        np.save(tmp_directory / f'{name}.npy', array)
+        arrays[name] = {'file': f'{name}.npy',
+                        'dtype': array.dtype.str, 'shape': list(array.shape)}
+    joblib.dump(model.random_state, tmp_directory / RANDOM_STATE_FILE)
+
+    params = model.get_params()
+    params.pop('random_state')
+    manifest = {'format_version': FORMAT_VERSION, 'params': params,
+                'arrays': arrays, 'last_delta_sequence': last_delta_sequence}
+    # manifest is written last, a directory without manifest is incomplete
+    with open(tmp_directory / MANIFEST_FILE, 'w') as file:
+        json.dump(manifest, file, indent=4)
+
+    shutil.rmtree(old_directory, ignore_errors=True)
+    if directory.exists():
+        os.replace(directory, old_directory)
+    os.replace(tmp_directory, directory)
+    shutil.rmtree(old_directory, ignore_errors=True)
+
+
+def load_model_arrays(directory: str | Path, mmap_mode: str | None = 'c') -> LightFM:
+    """
+    Loads model saved by `save_model_arrays`. If saving was interrupted between replacing directories, loads the previous one.
+
+    Args:
+        directory (str | Path): Directory to load from.
+        mmap_mode (str | None): Passed to np.load, 'c' maps files copy on write so the model can be trained
+        while unmodified pages stay shared.
+
+    Returns:
+        LightFM.
+
+    Raises:
+        FileNotFoundError: If there is no complete saved model.
+    """
+    directory = Path(directory)
+    if not (directory / MANIFEST_FILE).is_file():
+        directory = directory.with_name(directory.name + '.old')
+    with open(directory / MANIFEST_FILE) as file:
+        manifest = json.load(file)
+
+    model = LightFM(**manifest['params'])
+    model.random_state = joblib.load(directory / RANDOM_STATE_FILE)
+    for name, info in manifest['arrays'].items():
+        array = np.load(directory / info['file'], mmap_mode=mmap_mode)
+        setattr(model, name, array)
+    return model
+
+
+def get_last_delta_sequence(directory: str | Path) -> int:
+    """Gets sequence of the last delta contained by the model saved in `directory`."""
+    directory = Path(directory)
+    if not (directory / MANIFEST_FILE).is_file():
+        directory = directory.with_name(directory.name + '.old')
+    with open(directory / MANIFEST_FILE) as file:
+        return json.load(file).get('last_delta_sequence', 0)
+
+
+def copy_model(model: LightFM) -> LightFM:
+    """Returns a new model with the same params and a copy of every array of `model`."""
+    new_model = LightFM()
+    new_model.set_params(**model.get_params())
+    for name in MODEL_ARRAYS:
+        setattr(new_model, name, np.array(getattr(model, name)))
+    return new_model
+
+
+def shallow_copy_model(model: LightFM) -> LightFM:
+    """Returns a new model with the same params, random state and arrays as `model`, arrays are shared, not copied."""
+    new_model = LightFM()
+    new_model.set_params(**model.get_params())
+    for name in MODEL_ARRAYS:
+        setattr(new_model, name, getattr(model, name))
+    return new_model
+
+
+def save_model_delta(directory: str | Path, sequence: int, model: LightFM, changed_rows: dict[str, np.ndarray]) -> None:
+    """
+    Appends the rows `changed_rows[name]` of each array `name` of `model` to the delta log in `directory`.
+
+    Args:
+        directory (str | Path): Directory of the delta log.
+        sequence (int): Sequence of this delta, must be higher than sequences of previous deltas.
+        model (LightFM): Model the rows are taken from.
+        changed_rows (dict[str, np.ndarray]): Array name -> single dimensional array of row indices.
+
+    Returns:
+        None.
+    """
+    directory = Path(directory)
+    os.makedirs(directory, exist_ok=True)
+    data = {}
+    for name, rows in changed_rows.items():
+        array = getattr(model, name)
+        data[f'{name}__rows'] = rows
+        data[f'{name}__values'] = array[rows]
+        # arrays only grow, length lets replay allocate rows for new users
+        data[f'{name}__length'] = np.array(array.shape[0])
+    path = directory / f'{DELTA_PREFIX}{sequence:010d}.npz'
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as file:
+        np.savez(file, **data)
+    os.replace(tmp_path, path)
+
+
+def list_model_deltas(directory: str | Path) -> list[tuple[int, Path]]:
+    """Gets (sequence, path) of each delta in `directory` sorted by sequence."""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    deltas = [(int(path.stem[len(DELTA_PREFIX):]), path)
+              for path in directory.glob(f'{DELTA_PREFIX}*.npz')]
+    return sorted(deltas)
+
+
+def replay_model_deltas(directory: str | Path, model: LightFM, after_sequence: int) -> int:
+    """
+    Applies deltas from `directory` with sequence higher than `after_sequence` to `model` in order.
+
+    Args:
+        directory (str | Path): Directory of the delta log.
+        model (LightFM): Model to modify.
+        after_sequence (int): Deltas up to and including this sequence are already contained by `model`.
+
+    Returns:
+        int: Sequence of the last applied delta, `after_sequence` if none was applied.
+    """
+    last_sequence = after_sequence
+    for sequence, path in list_model_deltas(directory):
+        if sequence <= after_sequence:
+            continue
+        with np.load(path) as data:
+            for name in MODEL_ARRAYS:
+                if f'{name}__rows' not in data:
+                    continue
+                array = getattr(model, name)
+                length = int(data[f'{name}__length'])
+                if length > array.shape[0]:
+                    grown = np.zeros((length,) + array.shape[1:], dtype=array.dtype)
+                    grown[:array.shape[0]] = array
+                    array = grown
+                    setattr(model, name, array)
+                array[data[f'{name}__rows']] = data[f'{name}__values']
+        last_sequence = sequence
+    return last_sequence
+
+
+def remove_model_deltas(directory: str | Path, up_to_sequence: int) -> None:
+    """Deletes deltas from `directory` with sequence lower or equal to `up_to_sequence`."""
+    for sequence, path in list_model_deltas(directory):
+        if sequence <= up_to_sequence:
+            os.remove(path)
+
+
+def has_model_arrays(directory: str | Path) -> bool:
+    """Returns True if `directory` or its previous version has a complete saved model."""
+    directory = Path(directory)
+    return (directory / MANIFEST_FILE).is_file() or \
+        (directory.with_name(directory.name + '.old') / MANIFEST_FILE).is_file()
+
+
+def convert_pickle_to_model_arrays(pickle_path: str | Path, directory: str | Path) -> None:
+    """
+    Converts a joblib pickled model to the array format.
+
+    Args:
+        pickle_path (str | Path): Path of pickled model.
+        directory (str | Path): Directory to save to.
+
+    Returns:
+        None.
+    """
+    model = joblib.load(pickle_path)
+    save_model_arrays(model, directory)
@@ -0,0 +1,117 @@
+from collections import deque
+from threading import Condition, Lock
+from typing import Any, Iterator
+
+
+class ProgressSubscription:
+    """Messages of a ProgressChannel for a single subscriber, buffered in a deque that drops the oldest message when full."""
+
+    def __init__(self, channel: "ProgressChannel", max_buffered: int):
+        self.__channel = channel
+        self.__buffer: deque = deque(maxlen=max_buffered)
+        self.__is_closed = False
+        self.__condition = Condition()
+
+    def push(self, message: Any) -> None:
+        """Buffers `message` without blocking, the oldest message is dropped if the buffer is full."""
+        with self.__condition:
+            self.__buffer.append(message)
+            self.__condition.notify()
+
+    def close(self) -> None:
+        """Marks that no more messages are pushed, buffered messages can still be read."""
+        with self.__condition:
+            self.__is_closed = True
+            self.__condition.notify()
+
+    def get(self, timeout: float | None = None) -> Any | None:
+        """
+        Awaits and returns the oldest buffered message.
+
+        Args:
+            timeout (float | None): Seconds to wait, waits until a message is pushed or the channel is closed if None.
+
+        Returns:
+            Any | None: None if the channel was closed and every message was read, or `timeout` passed.
+        """
+        with self.__condition:
+            self.__condition.wait_for(
+                lambda: len(self.__buffer) > 0 or self.__is_closed, timeout)
+            if len(self.__buffer) > 0:
+                return self.__buffer.popleft()
+            return None
+
+    def unsubscribe(self) -> None:
+        """Detaches from the channel, it stops pushing messages to this subscription."""
+        self.__channel.unsubscribe(self)
+        self.close()
+
+    def __iter__(self) -> Iterator[Any]:
+        """Yields messages until the channel is closed."""
+        while True:
+            message = self.get()
+            if message is None:
+                return
+            yield message
+
+
+class ProgressChannel:
+    """
+    Publishes messages to any number of subscribers. Publishing never blocks on subscribers, each one has its own
+    bounded buffer, therefore a slow subscriber only loses its oldest messages. New subscribers first get the last message.
+    """
+
+    def __init__(self, max_buffered: int = 16):
+        self.max_buffered = max_buffered
+        self.__subscriptions: list[ProgressSubscription] = []
+        self.__last_message: Any | None = None
+        self.__is_closed = False
+        self.__lock = Lock()
+
+    def publish(self, message: Any) -> None:
+        """
+        Pushes `message` to every subscriber.
+
+        Args:
+            message (Any): Message, must not be None.
+
+        Returns:
+            None.
+        """
+        with self.__lock:
+            if self.__is_closed:
+                return
+            self.__last_message = message
+            for subscription in self.__subscriptions:
+                subscription.push(message)
+
+    def close(self) -> None:
+        """Closes the channel, subscribers read their buffered messages and stop."""
+        with self.__lock:
+            self.__is_closed = True
+            for subscription in self.__subscriptions:
+                subscription.close()
+            self.__subscriptions = []
+
+    def subscribe(self) -> ProgressSubscription:
+        """
+        Attaches a new subscriber.
+
+        Returns:
+            ProgressSubscription: Contains the last published message if there is one, closed if the channel is closed.
+        """
+        subscription = ProgressSubscription(self, self.max_buffered)
+        with self.__lock:
+            if self.__last_message is not None:
+                subscription.push(self.__last_message)
+            if self.__is_closed:
+                subscription.close()
+            else:
+                self.__subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ProgressSubscription) -> None:
+        """Detaches `subscription`, does nothing if it isn't attached."""
+        with self.__lock:
+            if subscription in self.__subscriptions:
+                self.__subscriptions.remove(subscription)
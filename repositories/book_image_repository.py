@@ -1,14 +1,60 @@
 import base64
 from pathlib import Path
+from byte_budget_cache import ByteBudgetLruCache
+import image_variants
 import utils
 
 
 class BookImageRepository:
 
+    # image filename -> image encoded in base64, strings are ascii therefore their length is their size in bytes
+    __base64_cache = ByteBudgetLruCache(max_bytes=64 * 1024 * 1024)
+
+    @staticmethod
+    def find_image_path(filename: str | Path) -> Path | None:
+        """
+        Finds image filepath.
+
+        Args:
+            filename (str | Path): Image filename.
+
+        Returns:
+            Path | None: None if `filename` isn't a str or Path or the file doesn't exist.
+        """
+        if type(filename) not in [str, Path]:
+            return None
+        filepath: Path = utils.BOOKS_DATA_IMAGES / filename
+        if filepath.is_file():
+            return filepath
+        return None
+
+    @staticmethod
+    def find_image_variant_path(filename: str | Path, variant: str, format: str) -> Path | None:
+        """
+        Finds filepath of a resized variant of image, the variant is written first if it is missing or outdated.
+        Filepath of the image itself if the variant can't be written, see image_variants.find_up_to_date_variant_path.
+
+        Args:
+            filename (str | Path): Image filename.
+            variant (str): Variant name, see image_variants.VARIANT_WIDTHS.
+            format (str): Format name, see image_variants.VARIANT_FORMATS.
+
+        Returns:
+            Path | None: None if `filename` isn't a str or Path or the image doesn't exist.
+        """
+        if type(filename) not in [str, Path]:
+            return None
+        return image_variants.find_up_to_date_variant_path(filename, variant, format)
+
+    @staticmethod
+    def is_image_variant_path(filepath: Path) -> bool:
+        """Returns True if `filepath` is a resized variant, False if it is an image, see find_image_variant_path."""
+        return image_variants.is_variant_path(filepath)
+
     @staticmethod
     def convert_image_base64(filename: str | Path) -> str | None:
         """
-        Finds image and converts it to base64.
+        Finds image and converts it to base64, cached, concurrent misses of the same image read it once.
 
         Args:
             filename (str | Path): Image filepath to convert.
@@ -18,8 +64,19 @@ class BookImageRepository:
         """
         if type(filename) not in [str, Path]:
             return None
-        filepath: Path = utils.BOOKS_DATA_IMAGES / filename
-        if filepath.is_file():
+        return BookImageRepository.__base64_cache.get_or_load(
+            str(filename), lambda: BookImageRepository.__read_image_base64(filename))
+
+    @staticmethod
+    def get_cache_stats() -> dict:
+        """Gets counters of the cache of images encoded in base64, see ByteBudgetLruCache.get_stats."""
+        return BookImageRepository.__base64_cache.get_stats()
+
+    @staticmethod
+    def __read_image_base64(filename: str | Path) -> str | None:
+        """Reads image and converts it to base64, None if it doesn't exist."""
+        filepath = BookImageRepository.find_image_path(filename)
+        if filepath is not None:
             with open(filepath, 'rb') as file:
                 binary_data = file.read()
                 base64_bytes = base64.b64encode(binary_data)
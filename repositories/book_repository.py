@@ -108,8 +108,9 @@ class BookRepository:
         Returns:
             list[Book]. List that has same order as `ids`.
         """
-        # list has index method while np.ndarray doesn't
-        # therefore convert to list, does nothing if it is already a list
-        ids = list(ids)
-        models = sorted(models, key=lambda x: ids.index(x.id))
+        # map each id to its first position so sorting doesn't search the ids list for every model
+        positions = {}
+        for position, id in enumerate(ids):
+            positions.setdefault(int(id), position)
+        models = sorted(models, key=lambda x: positions[x.id])
         return models
@@ -0,0 +1,116 @@
+import os
+from pathlib import Path
+import numpy as np
+from utils import BOOKS_DATA_ITEM_NEIGHBORS, BOOKS_DATA_ITEM_NEIGHBORS_TMP, BOOKS_DATA_ITEM_NEIGHBORS_VECTORS, \
+    BOOKS_DATA_ITEM_NEIGHBORS_VECTORS_TMP
+
+# version of a table loaded from disk, model versions restart at 0 with the process, therefore it matches no snapshot
+# until a job checked its vectors against the items and published it again
+LOADED_TABLE_VERSION = -1
+
+
+def load_published_table(table_path: str | os.PathLike, vectors_path: str | os.PathLike) -> tuple[np.ndarray, int, np.ndarray] | None:
+    """
+    Loads the table published by a previous process with the vectors it was computed for, both memory mapped.
+
+    Args:
+        table_path (str | os.PathLike): Path of the table.
+        vectors_path (str | os.PathLike): Path of the vectors, missing if publishing was interrupted.
+
+    Returns:
+        tuple[np.ndarray, int, np.ndarray] | None: (table, LOADED_TABLE_VERSION, vectors), None if either file is missing
+        or they have different number of rows.
+    """
+    if not os.path.exists(table_path) or not os.path.exists(vectors_path):
+        return None
+    neighbors = np.load(table_path, mmap_mode='r')
+    vectors = np.load(vectors_path, mmap_mode='r')
+    if neighbors.shape[0] != vectors.shape[0]:
+        return None
+    return neighbors, LOADED_TABLE_VERSION, vectors
+
+
+class ItemNeighborsRepository:
+
+    # (memory mapped table, model version it was computed for, normalized item representations it was computed for),
+    # swapped as a single reference
+    __table: tuple[np.ndarray, int, np.ndarray] | None = load_published_table(
+        BOOKS_DATA_ITEM_NEIGHBORS, BOOKS_DATA_ITEM_NEIGHBORS_VECTORS)
+
+    def __init__(self):
+        """No attributes."""
+
+    def find_neighbors(self, id: int, version: int) -> np.ndarray | None:
+        """
+        Finds precomputed nearest neighbors indices of book with `id`.
+
+        Args:
+            id (int): Book id.
+            version (int): Model version the table must be computed for.
+
+        Returns:
+            np.ndarray (one dimensional array) | None: None if there is no table for `version` or `id` doesn't exist.
+        """
+        table = ItemNeighborsRepository.__table
+        if table is None or table[1] != version:
+            return None
+        neighbors = table[0]
+        if id < 0 or id >= neighbors.shape[0]:
+            return None
+        return np.asarray(neighbors[id])
+
+    def find_neighbors_of_many(self, ids: list[int], version: int) -> np.ndarray | None:
+        """
+        Finds precomputed nearest neighbors indices of books with `ids`.
+
+        Args:
+            ids (list[int]): Book ids.
+            version (int): Model version the table must be computed for.
+
+        Returns:
+            np.ndarray (two dimensional array, row i belongs to ids[i]) | None: None if there is no table for `version`
+            or any id doesn't exist.
+        """
+        table = ItemNeighborsRepository.__table
+        if table is None or table[1] != version:
+            return None
+        neighbors = table[0]
+        if any(id < 0 or id >= neighbors.shape[0] for id in ids):
+            return None
+        return np.asarray(neighbors[ids])
+
+    def find_table(self) -> tuple[np.ndarray, np.ndarray] | None:
+        """
+        Gets the published table whatever model version it was computed for, including a table loaded from disk.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray] | None: (table, normalized item representations it was computed for),
+            None if no table was published.
+        """
+        table = ItemNeighborsRepository.__table
+        return None if table is None else (table[0], table[2])
+
+    def get_temporary_path(self) -> Path:
+        """Gets path where a new table is written before it is published."""
+        return BOOKS_DATA_ITEM_NEIGHBORS_TMP
+
+    def publish(self, version: int, vectors: np.ndarray) -> None:
+        """
+        Atomically replaces the table with the one written to `get_temporary_path()`. Readers of the previous table
+        keep their memory map because the old file stays alive until it is unmapped. `vectors` are saved next to the table,
+        the next process loads both and only computes again rows whose vectors drifted.
+
+        Args:
+            version (int): Model version the new table was computed for.
+            vectors (np.ndarray): Normalized item representations the new table was computed for.
+
+        Returns:
+            None.
+        """
+        np.save(BOOKS_DATA_ITEM_NEIGHBORS_VECTORS_TMP, vectors)
+        # without vectors the table isn't loaded, therefore an interrupted publish never pairs a table with other vectors
+        BOOKS_DATA_ITEM_NEIGHBORS_VECTORS.unlink(missing_ok=True)
+        os.replace(BOOKS_DATA_ITEM_NEIGHBORS_TMP, BOOKS_DATA_ITEM_NEIGHBORS)
+        os.replace(BOOKS_DATA_ITEM_NEIGHBORS_VECTORS_TMP, BOOKS_DATA_ITEM_NEIGHBORS_VECTORS)
+        neighbors = np.load(BOOKS_DATA_ITEM_NEIGHBORS, mmap_mode='r')
+        ItemNeighborsRepository.__table = (neighbors, version, np.load(BOOKS_DATA_ITEM_NEIGHBORS_VECTORS, mmap_mode='r'))
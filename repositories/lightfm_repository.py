@@ -1,29 +1,123 @@
-import joblib
-from utils import BOOKS_DATA_MODEL
+from threading import Lock, Thread
+from growable_array import GrowableArray
+from model_snapshot import ModelSnapshot
+from model_storage import MODEL_ARRAYS, convert_pickle_to_model_arrays, copy_model, get_last_delta_sequence, has_model_arrays, \
+    load_model_arrays, remove_model_deltas, replay_model_deltas, save_model_arrays, save_model_delta, shallow_copy_model
+from utils import BOOKS_DATA_MODEL, BOOKS_DATA_MODEL_ARRAYS, BOOKS_DATA_MODEL_DELTAS
 import numpy as np
 from scipy.sparse import hstack, csr_matrix, identity, vstack
 from lightfm import LightFM
 
 
+# pickled models from before the array format are converted once
+if not has_model_arrays(BOOKS_DATA_MODEL_ARRAYS):
+    convert_pickle_to_model_arrays(BOOKS_DATA_MODEL, BOOKS_DATA_MODEL_ARRAYS)
+
+
 class LightfmRepository:
 
-    __model : LightFM = joblib.load(BOOKS_DATA_MODEL)
+    __USER_ARRAYS = [name for name in MODEL_ARRAYS if name.startswith('user_')]
+    __ITEM_ARRAYS = [name for name in MODEL_ARRAYS if name.startswith('item_')]
+
+    # a new snapshot is written and the delta log is emptied after this many deltas
+    COMPACT_EVERY_N_DELTAS = 50
+
+    # arrays are memory mapped copy on write, only modified pages use private memory
+    __model : LightFM = load_model_arrays(BOOKS_DATA_MODEL_ARRAYS)
+    __last_compacted_delta_sequence: int = get_last_delta_sequence(BOOKS_DATA_MODEL_ARRAYS)
+    __delta_sequence: int = replay_model_deltas(
+        BOOKS_DATA_MODEL_DELTAS, __model, __last_compacted_delta_sequence)
+    # array name -> row indices changed since the last save
+    __changed_rows: dict[str, list[np.ndarray]] = {}
+    __persistence_lock = Lock()
+    __is_compacting = False
+    # user array name -> buffer whose view is the array of the current model, grown by add_new_user_embeddings.
+    # The first add copies the memory mapped user array into the buffer, its pages aren't shared between processes anymore,
+    # growing into a larger memory mapped file would keep them shared but the saved arrays are read only snapshots, see model_storage
+    __user_buffers: dict[str, GrowableArray] = {}
+    # (shape, dtype) -> infinite item gradients shared by models created with freeze_items
+    __frozen_item_gradients: dict[tuple, np.ndarray] = {}
+    # replaced by a single assignment, readers that got the previous snapshot keep using it
+    __snapshot = ModelSnapshot(__model, version=0)
+    del __model
 
     def __init__(self):
         """No attributes."""
 
+    def get_snapshot(self) -> ModelSnapshot:
+        """Gets the current snapshot, a request should get it once and use it for all its computations."""
+        return LightfmRepository.__snapshot
+
+    def publish_snapshot(self, snapshot: ModelSnapshot) -> None:
+        """Makes `snapshot` the current snapshot. Must be called by one writer at a time."""
+        LightfmRepository.__snapshot = snapshot
+
     def get_model(self) -> LightFM:
-        """Gets the lightFM model."""
-        return LightfmRepository.__model
+        """Gets the lightFM model of the current snapshot."""
+        return LightfmRepository.__snapshot.model
+
+    def get_version(self) -> int:
+        """Gets the version of the current snapshot, it changes every time trained data is transfered to the model."""
+        return LightfmRepository.__snapshot.version
     
     def save_model(self) -> None:
-        """Saves model."""
-        joblib.dump(LightfmRepository.__model, BOOKS_DATA_MODEL)
+        """
+        Saves model by appending rows changed since the last save to the delta log. Every COMPACT_EVERY_N_DELTAS deltas,
+        a copy of the model is written as the new snapshot in the background. Must be called while the model can't change.
+        """
+        with LightfmRepository.__persistence_lock:
+            changed_rows = {name: np.unique(np.concatenate(rows))
+                            for name, rows in LightfmRepository.__changed_rows.items()}
+            LightfmRepository.__changed_rows = {}
+            if len(changed_rows) == 0:
+                return
+            LightfmRepository.__delta_sequence += 1
+            save_model_delta(BOOKS_DATA_MODEL_DELTAS, LightfmRepository.__delta_sequence,
+                             self.get_model(), changed_rows)
+
+            nr_deltas = LightfmRepository.__delta_sequence - \
+                LightfmRepository.__last_compacted_delta_sequence
+            if nr_deltas < LightfmRepository.COMPACT_EVERY_N_DELTAS or LightfmRepository.__is_compacting:
+                return
+            LightfmRepository.__is_compacting = True
+            # copy so the snapshot is consistent while training keeps modifying the model
+            model_copy = copy_model(self.get_model())
+            Thread(target=LightfmRepository.__compact, args=(model_copy, LightfmRepository.__delta_sequence),
+                   daemon=True).start()
+
+    def mark_changed_rows(self, name: str, rows: np.ndarray | list[int]) -> None:
+        """
+        Marks `rows` of model array `name` to be written by the next `save_model`.
+
+        Args:
+            name (str): Name of the array, for example 'user_embeddings'.
+            rows (np.ndarray | list[int]): Row indices.
+
+        Returns:
+            None.
+        """
+        with LightfmRepository.__persistence_lock:
+            LightfmRepository.__changed_rows.setdefault(
+                name, []).append(np.asarray(rows, dtype=np.int64))
+
+    @staticmethod
+    def __compact(model: LightFM, delta_sequence: int) -> None:
+        """Writes `model`, which contains all deltas up to `delta_sequence`, as the new snapshot and deletes those deltas."""
+        try:
+            save_model_arrays(model, BOOKS_DATA_MODEL_ARRAYS, delta_sequence)
+            remove_model_deltas(BOOKS_DATA_MODEL_DELTAS, delta_sequence)
+            with LightfmRepository.__persistence_lock:
+                LightfmRepository.__last_compacted_delta_sequence = delta_sequence
+        finally:
+            with LightfmRepository.__persistence_lock:
+                LightfmRepository.__is_compacting = False
 
     def add_new_user_embeddings(self, nr_users_to_add: int) -> None:
         """
         Adds new user embedding, biases, gradients and momentum for each new user feature. Code imitates _initialize method from
         https://github.com/lyst/lightfm/blob/master/lightfm/lightfm.py
+        Arrays are grown on a copy of the model that is published as a snapshot with the same version, because new users
+        don't change recommendations of other users. Must be called by one writer at a time.
 
         Args:
             nr_users_to_add (int): Number of users.
@@ -31,8 +125,9 @@ class LightfmRepository:
         Returns:
             None.
         """
-        # for faster writing
-        model = LightfmRepository.__model
+        snapshot = LightfmRepository.__snapshot
+        model = shallow_copy_model(snapshot.model)
+        nr_users = model.user_embeddings.shape[0]
 
         random_state = model.random_state
         nr_components = model.no_components
@@ -58,21 +153,79 @@ class LightfmRepository:
             new_user_embedding_gradients += 1
             new_user_bias_gradients += 1
 
-        # add new embeddings as new rows to model
-        model.user_embeddings = np.concatenate(
-            [model.user_embeddings, new_user_embeddings], axis=0, dtype=np.float32)
-        model.user_embedding_gradients = np.concatenate(
-            [model.user_embedding_gradients, new_user_embedding_gradients], axis=0, dtype=np.float32)
-        model.user_embedding_momentum = np.concatenate(
-            [model.user_embedding_momentum, new_user_embedding_momentum], axis=0, dtype=np.float32)
-
-        # add new biases as new columns to model (biases are row vectors)
-        model.user_biases = np.concatenate(
-            [model.user_biases, new_user_biases], axis=0, dtype=np.float32)
-        model.user_bias_gradients = np.concatenate(
-            [model.user_bias_gradients, new_user_bias_gradients], axis=0, dtype=np.float32)
-        model.user_bias_momentum = np.concatenate(
-            [model.user_bias_momentum, new_user_bias_momentum], axis=0, dtype=np.float32)
+        new_rows_by_name = {
+            'user_embeddings': new_user_embeddings,
+            'user_embedding_gradients': new_user_embedding_gradients,
+            'user_embedding_momentum': new_user_embedding_momentum,
+            'user_biases': new_user_biases,
+            'user_bias_gradients': new_user_bias_gradients,
+            'user_bias_momentum': new_user_bias_momentum,
+        }
+        # add new rows in the spare capacity of the buffers, previous snapshots have views with less rows, they don't see them
+        for name, rows in new_rows_by_name.items():
+            buffer = LightfmRepository.__get_user_buffer(name, getattr(model, name))
+            setattr(model, name, buffer.append(rows))
+
+        new_rows = np.arange(nr_users, nr_users + nr_users_to_add)
+        for name in LightfmRepository.__USER_ARRAYS:
+            self.mark_changed_rows(name, new_rows)
+        self.publish_snapshot(snapshot.derive_with_same_items(model, snapshot.version))
+
+    def new_snapshot_with_trained_users(self, new_model: LightFM, user_features: csr_matrix,
+                                        base_model: LightFM | None = None, transfer_items: bool = True) -> ModelSnapshot:
+        """
+        Creates the next snapshot from the current one and the data trained in `new_model`, it isn't published.
+        Item arrays of the current snapshot aren't modified, user rows of `user_features` are written in the shared user arrays.
+        Must be called by one writer at a time.
+
+        Args:
+            new_model (LightFM): Model created by `new_model_with_users` from `user_features` and trained.
+            user_features (csr_matrix): csr_matrix with one row containing features for each trained user.
+            base_model (LightFM | None): Model `new_model` was created from, see `transfer_data_from_new_model_to_model`.
+            transfer_items (bool): If False, item arrays of `new_model` are ignored, must be False for models created with `freeze_items`.
+
+        Returns:
+            ModelSnapshot: Snapshot without item representations and index if `transfer_items`, otherwise
+            with the ones of the current snapshot.
+        """
+        snapshot = LightfmRepository.__snapshot
+        model = shallow_copy_model(snapshot.model)
+        LightfmRepository.transfer_data_from_new_model_to_model(
+            new_model, model, user_features, base_model, transfer_items)
+        if transfer_items:
+            return ModelSnapshot(model, snapshot.version + 1)
+        # items didn't change, therefore their representations, index and precomputed neighbors stay valid
+        return snapshot.derive_with_same_items(model, snapshot.version + 1)
+
+    def new_snapshot_with_user_embedding(self, feature_index: int, embedding: np.ndarray, bias: float) -> ModelSnapshot:
+        """
+        Creates the next snapshot from the current one with a new embedding and bias for user feature `feature_index`,
+        it isn't published. Row is written in the shared user arrays, item arrays don't change. Must be called by one writer at a time.
+
+        Args:
+            feature_index (int): Row of user arrays.
+            embedding (np.ndarray): Single dimensional array with `no_components` values.
+            bias (float): User feature bias.
+
+        Returns:
+            ModelSnapshot.
+        """
+        snapshot = LightfmRepository.__snapshot
+        model = shallow_copy_model(snapshot.model)
+        model.user_embeddings[feature_index] = embedding
+        model.user_biases[feature_index] = bias
+        self.mark_changed_rows('user_embeddings', [feature_index])
+        self.mark_changed_rows('user_biases', [feature_index])
+        return snapshot.derive_with_same_items(model, snapshot.version + 1)
+
+    @staticmethod
+    def get_feature_indices(user_features: csr_matrix) -> np.ndarray:
+        """
+        Gets sorted indices of features used by any row of `user_features`, row i of a model created by `new_model_with_users`
+        belongs to feature i of the result. Therefore `user_features[:, get_feature_indices(user_features)]` are the user
+        features of that model.
+        """
+        return np.unique(user_features.nonzero()[1])
 
     @staticmethod
     def new_model_with_single_user(user_feature: csr_matrix, model: LightFM) -> LightFM:
@@ -82,25 +235,64 @@ class LightfmRepository:
         Args:
             user_feature (csr_matrix): csr_matrix of single row containing features for this user.
 
+        Returns:
+            LightFM.
+        """
+        return LightfmRepository.new_model_with_users(user_feature, model)
+
+    @staticmethod
+    def can_freeze_items(model: LightFM) -> bool:
+        """Returns True if `new_model_with_users` can create a model from `model` with `freeze_items`."""
+        return model.learning_schedule == 'adagrad'
+
+    @staticmethod
+    def new_model_with_users(user_features: csr_matrix, model: LightFM, freeze_items: bool = False) -> LightFM:
+        """
+        Creates and returns a new lightFM model with embeddings from features used by any of many users and all item embeddings,
+        so the users can be trained together.
+
+        Args:
+            user_features (csr_matrix): csr_matrix with one row containing features for each user.
+            freeze_items (bool): If True, training only changes user arrays. Item arrays are shared with `model`
+            instead of copied, see `__get_frozen_item_gradients`. Only for models where `can_freeze_items` is True.
+
         Returns:
             LightFM.
         """
         # get indices of features
-        feature_indices = user_feature.nonzero()[1]
+        feature_indices = LightfmRepository.get_feature_indices(user_features)
         new_model = LightFM()
 
         # copy params to new model
         new_model.set_params(**model.get_params())
 
-        # copy all item biases, embeddings
-        new_model.item_biases = model.item_biases.copy()
-        new_model.item_embeddings = model.item_embeddings.copy()
+        if freeze_items:
+            # item_alpha rescales item arrays after training
+            new_model.set_params(item_alpha=0.0)
+            # fit_partial writes the item rows it updates back in place, items have a learning rate of exactly 0 therefore
+            # the written values are the values read, items of `model` and of the snapshots sharing them stay bitwise equal.
+            # LightFM rejects read only arrays. Measured with 50000 items and 200 components: copying took 20 ms and
+            # 40 MB for each batch, sharing copies nothing, the first frozen training of the process turns the memory mapped
+            # pages of item arrays private, like a single copy kept for the process lifetime
+            new_model.item_biases = model.item_biases
+            new_model.item_embeddings = model.item_embeddings
+            new_model.item_bias_gradients = LightfmRepository.__get_frozen_item_gradients(
+                model.item_bias_gradients)
+            new_model.item_embedding_gradients = LightfmRepository.__get_frozen_item_gradients(
+                model.item_embedding_gradients)
+            # momentum is only used by adadelta
+            new_model.item_bias_momentum = model.item_bias_momentum
+            new_model.item_embedding_momentum = model.item_embedding_momentum
+        else:
+            # copy all item biases, embeddings
+            new_model.item_biases = model.item_biases.copy()
+            new_model.item_embeddings = model.item_embeddings.copy()
 
-        # copy all item, embedding gradients, momentum
-        new_model.item_bias_gradients = model.item_bias_gradients.copy()
-        new_model.item_embedding_gradients = model.item_embedding_gradients.copy()
-        new_model.item_bias_momentum = model.item_bias_momentum.copy()
-        new_model.item_embedding_momentum = model.item_embedding_momentum.copy()
+            # copy all item, embedding gradients, momentum
+            new_model.item_bias_gradients = model.item_bias_gradients.copy()
+            new_model.item_embedding_gradients = model.item_embedding_gradients.copy()
+            new_model.item_bias_momentum = model.item_bias_momentum.copy()
+            new_model.item_embedding_momentum = model.item_embedding_momentum.copy()
 
         new_model.user_biases = model.user_biases[feature_indices].copy()
         new_model.user_embeddings = model.user_embeddings[feature_indices].copy(
@@ -118,27 +310,67 @@ class LightfmRepository:
         return new_model
 
     @staticmethod
-    def transfer_data_from_new_model_to_model(new_model: LightFM, model: LightFM, user_feature: csr_matrix) -> None:
+    def __get_frozen_item_gradients(gradients: np.ndarray) -> np.ndarray:
+        """
+        Gets an array shaped like `gradients` filled with infinity. Adagrad divides the learning rate by the square root
+        of the accumulated gradients, therefore items get a learning rate of 0 and every update writes back the same value.
+        The array is reused by all frozen models, adding to infinity leaves it unchanged, therefore it is allocated once
+        for each shape in the process, not for each training.
+        """
+        key = (gradients.shape, gradients.dtype.str)
+        frozen_gradients = LightfmRepository.__frozen_item_gradients.get(key)
+        if frozen_gradients is None:
+            frozen_gradients = np.full(gradients.shape, np.inf, dtype=gradients.dtype)
+            LightfmRepository.__frozen_item_gradients[key] = frozen_gradients
+        return frozen_gradients
+
+    @staticmethod
+    def __get_user_buffer(name: str, array: np.ndarray) -> GrowableArray:
+        """
+        Gets the buffer of user array `name` whose view is `array`. If `array` isn't its view, for example on the first add
+        or if the array was replaced, a new buffer is created from `array`.
+        """
+        buffer = LightfmRepository.__user_buffers.get(name)
+        if buffer is None or buffer.is_view(array) == False:
+            buffer = GrowableArray(array.astype(np.float32, copy=False))
+            LightfmRepository.__user_buffers[name] = buffer
+        return buffer
+
+    @staticmethod
+    def transfer_data_from_new_model_to_model(new_model: LightFM, model: LightFM, user_feature: csr_matrix,
+                                              base_model: LightFM | None = None, transfer_items: bool = True) -> None:
         """
         Copies all `user_feature` embeddings, gradients, momentum from `new_model` to `model`. Also copies trained item embeddings, gradients, momentum.
 
         Args:
-            new_model (LightFM): Model trained on only one user feature from `user_feature`.
+            new_model (LightFM): Model created by `new_model_with_users` from `user_feature` and trained.
             model (LightFM): Model with all user features.
-            user_feature (csr_matrix): csr_matrix of single row containing features for this user.
+            user_feature (csr_matrix): csr_matrix with one row containing features for each trained user.
+            base_model (LightFM | None): Model `new_model` was created from. If item arrays of `model` were replaced since,
+            because other trainings were transfered, the changes made by training are added to them instead of replacing them.
+            transfer_items (bool): If False, only user rows are copied.
 
         Returns:
             None.
         """
-        feature_indices = user_feature.nonzero()[1]
-        # new_model has the same size for item features, therefore copy all because they have been updated
-        model.item_biases = new_model.item_biases.copy()
-        model.item_embeddings = new_model.item_embeddings.copy()
-
-        model.item_bias_gradients = new_model.item_bias_gradients.copy()
-        model.item_embedding_gradients = new_model.item_embedding_gradients.copy()
-        model.item_bias_momentum = new_model.item_bias_momentum.copy()
-        model.item_embedding_momentum = new_model.item_embedding_momentum.copy()
+        feature_indices = LightfmRepository.get_feature_indices(user_feature)
+        repository = LightfmRepository()
+        if transfer_items:
+            for name in LightfmRepository.__ITEM_ARRAYS:
+                old_array, new_array = getattr(model, name), getattr(new_model, name)
+                if base_model is not None and getattr(base_model, name) is not old_array:
+                    new_array = old_array + (new_array - getattr(base_model, name))
+                else:
+                    # new_model has the same size for item features, therefore copy all because they have been updated
+                    new_array = new_array.copy()
+                # only rows that training changed are saved
+                changed = old_array != new_array
+                if changed.ndim > 1:
+                    changed = changed.any(axis=1)
+                repository.mark_changed_rows(name, np.flatnonzero(changed))
+                setattr(model, name, new_array)
+        for name in LightfmRepository.__USER_ARRAYS:
+            repository.mark_changed_rows(name, feature_indices)
 
         # copy modified user biases, embeddings, gradients momentum
         model.user_biases[feature_indices] = new_model.user_biases.copy()
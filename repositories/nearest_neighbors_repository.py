@@ -1,31 +1,104 @@
 import numpy as np
-from scipy.sparse import csr_matrix, load_npz, save_npz
-from sklearn.neighbors import NearestNeighbors
-from utils import BOOKS_DATA_USER_FEATURES
+from app import app
+from vector_index import ExactCosineIndex, IvfCosineIndex
 
 
 class NearestNeighborsRepository:
 
-    __model = NearestNeighbors(n_neighbors=30, metric='cosine')
+    N_NEIGHBORS = 30
+    # cosine distance between old and new item representation above which the item is updated in the index
+    DRIFT_THRESHOLD = 1e-4
+    # if more than this fraction of items drifted, the index is rebuilt instead of updated
+    MAX_UPDATED_FRACTION = 0.1
 
     def __init__(self):
         """No attributes."""
 
-    def get_model(self) -> NearestNeighbors:
-        return NearestNeighborsRepository.__model
-    
-    def get_nearest_neighbors_for_single_item(self, item_representation: np.ndarray) -> np.ndarray:
+    def build_index(self, item_representations: np.ndarray) -> ExactCosineIndex | IvfCosineIndex:
+        """
+        Builds a new index from `item_representations`, its type is selected by NEIGHBOR_INDEX in app config.
+
+        Args:
+            item_representations (np.ndarray): Two dimensional array, row i belongs to book with id i.
+
+        Returns:
+            ExactCosineIndex | IvfCosineIndex.
+
+        Raises:
+            ValueError: If type of NEIGHBOR_INDEX isn't exact or ivf.
+        """
+        # read from the app, not the request, indexes are also built by background jobs
+        config = app.config.get('NEIGHBOR_INDEX', {'type': 'exact'})
+        if config['type'] == 'exact':
+            index = ExactCosineIndex(n_neighbors=NearestNeighborsRepository.N_NEIGHBORS)
+        elif config['type'] == 'ivf':
+            index = IvfCosineIndex(n_neighbors=NearestNeighborsRepository.N_NEIGHBORS,
+                                   n_lists=config.get('n_lists', 256), n_probe=config.get('n_probe', 8))
+        else:
+            raise ValueError(f"Neighbor index type {config['type']} doesn't exist")
+        return index.fit(item_representations)
+
+    def find_drifted_rows(self, index: ExactCosineIndex | IvfCosineIndex, item_representations: np.ndarray,
+                          threshold: float) -> np.ndarray:
+        """
+        Finds books whose representation in `item_representations` moved more than `threshold` cosine distance from the one in `index`.
+
+        Args:
+            index (ExactCosineIndex | IvfCosineIndex): Index to compare with.
+            item_representations (np.ndarray): Two dimensional array, row i belongs to book with id i.
+            threshold (float): Cosine distance.
+
+        Returns:
+            np.ndarray: Single dimensional array of book ids.
+        """
+        return index.find_drifted_rows(item_representations, threshold)
+
+    def build_updated_index(self, index: ExactCosineIndex | IvfCosineIndex, ids: np.ndarray,
+                            item_representations: np.ndarray) -> ExactCosineIndex | IvfCosineIndex:
+        """
+        Copies `index` and replaces representations of books with `ids` in the copy, `index` isn't modified.
+
+        Args:
+            index (ExactCosineIndex | IvfCosineIndex): Index to copy.
+            ids (np.ndarray): Single dimensional array of book ids.
+            item_representations (np.ndarray): Two dimensional array, new representation of each book in `ids`.
+
+        Returns:
+            ExactCosineIndex | IvfCosineIndex.
+        """
+        new_index = index.copy()
+        new_index.update(ids, item_representations)
+        return new_index
+
+    def get_nearest_neighbors_for_single_item(self, index: ExactCosineIndex | IvfCosineIndex,
+                                              item_representation: np.ndarray) -> np.ndarray:
         """
         Gets the indices of the nearest neighbors of a single book using `item_representation`.
 
         Args:
+            index (ExactCosineIndex | IvfCosineIndex): Index to search.
             item_representation (np.ndarray): A one dimensional array.
 
         Returns:
             np.ndarray (one dimensional array): A one dimensional array containing the indices of the nearest neighbors of book.
         """
         # kneighbors takes as input an array with 2 dim, one row for each item
-        # and also returns a tuple therefore index it by [0]
-        indices = NearestNeighborsRepository.__model.kneighbors(
-            [item_representation], return_distance=False)[0]
-        return indices
\ No newline at end of file
+        indices = self.get_nearest_neighbors_for_items(
+            index, item_representation.reshape(1, -1))[0]
+        # approximate search marks missing neighbors with -1
+        return indices[indices >= 0]
+
+    def get_nearest_neighbors_for_items(self, index: ExactCosineIndex | IvfCosineIndex,
+                                        item_representations: np.ndarray) -> np.ndarray:
+        """
+        Gets the indices of the nearest neighbors of many books using `item_representations` in a single search.
+
+        Args:
+            index (ExactCosineIndex | IvfCosineIndex): Index to search.
+            item_representations (np.ndarray): A two dimensional array, one row for each book.
+
+        Returns:
+            np.ndarray (two dimensional array): Row i contains the indices of the nearest neighbors of book i,
+            approximate search marks missing neighbors with -1.
+        """
+        return index.kneighbors(item_representations)
@@ -0,0 +1,46 @@
+import numpy as np
+from lru_ttl_cache import LruTtlCache
+
+
+class RecommendationCacheRepository:
+
+    # values are book ids of recommendations, keys must contain the model version
+    __cache = LruTtlCache(max_size=10_000, ttl=60 * 60)
+
+    def __init__(self):
+        """No attributes."""
+
+    def get(self, key: tuple) -> np.ndarray | None:
+        """
+        Gets cached recommendation ids by `key`.
+
+        Args:
+            key (tuple): Model version followed by request inputs.
+
+        Returns:
+            np.ndarray (single dimensional read only array) | None.
+        """
+        return RecommendationCacheRepository.__cache.get(key)
+
+    def set(self, key: tuple, ids: np.ndarray) -> None:
+        """
+        Caches recommendation `ids` by `key`.
+
+        Args:
+            key (tuple): Model version followed by request inputs.
+            ids (np.ndarray): Single dimensional array of book ids.
+
+        Returns:
+            None.
+        """
+        ids = np.array(ids)
+        ids.setflags(write=False)
+        RecommendationCacheRepository.__cache.set(key, ids)
+
+    def clear(self) -> None:
+        """Deletes all cached recommendations."""
+        RecommendationCacheRepository.__cache.clear()
+
+    def get_stats(self) -> dict:
+        """Gets cache counters."""
+        return RecommendationCacheRepository.__cache.get_stats()
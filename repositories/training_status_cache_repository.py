@@ -0,0 +1,53 @@
+from threading import Lock
+from dtos.book_recommenders.training_status_dto import TrainingStatusDto
+
+
+class TrainingStatusCacheRepository:
+
+    # user id -> (key, status), a single status per user, keys are (model version, rating version, liked category version)
+    __statuses: dict[int, tuple[tuple, TrainingStatusDto]] = {}
+    __lock = Lock()
+
+    def __init__(self):
+        """No attributes."""
+
+    def get(self, user_id: int, key: tuple) -> TrainingStatusDto | None:
+        """
+        Gets the status of `user_id` cached under `key`.
+
+        Args:
+            user_id (int): User id.
+            key (tuple): Versions the status was computed from.
+
+        Returns:
+            TrainingStatusDto | None: None if there is no status or it was cached under another key.
+        """
+        entry = TrainingStatusCacheRepository.__statuses.get(user_id)
+        if entry is None or entry[0] != key:
+            return None
+        return entry[1]
+
+    def set(self, user_id: int, key: tuple, dto: TrainingStatusDto) -> None:
+        """
+        Caches status `dto` of `user_id` under `key`, replaces the status cached under any other key.
+
+        Args:
+            user_id (int): User id.
+            key (tuple): Versions the status was computed from.
+            dto (TrainingStatusDto): Status, must not be modified after it is cached.
+
+        Returns:
+            None.
+        """
+        with TrainingStatusCacheRepository.__lock:
+            TrainingStatusCacheRepository.__statuses[user_id] = (key, dto)
+
+    def invalidate(self, user_id: int) -> None:
+        """Deletes the cached status of `user_id`."""
+        with TrainingStatusCacheRepository.__lock:
+            TrainingStatusCacheRepository.__statuses.pop(user_id, None)
+
+    def clear(self) -> None:
+        """Deletes all cached statuses."""
+        with TrainingStatusCacheRepository.__lock:
+            TrainingStatusCacheRepository.__statuses.clear()
@@ -0,0 +1,32 @@
+from threading import Lock
+
+
+class UserDataVersionRepository:
+
+    # user id -> number of times the data changed since the process started
+    __rating_versions: dict[int, int] = {}
+    __liked_category_versions: dict[int, int] = {}
+    __lock = Lock()
+
+    def __init__(self):
+        """No attributes."""
+
+    def get_rating_version(self, user_id: int) -> int:
+        """Gets version of book ratings for `user_id`."""
+        return UserDataVersionRepository.__rating_versions.get(user_id, 0)
+
+    def increment_rating_version(self, user_id: int) -> None:
+        """Increments version of book ratings for `user_id`, called every time the user rates a book."""
+        with UserDataVersionRepository.__lock:
+            versions = UserDataVersionRepository.__rating_versions
+            versions[user_id] = versions.get(user_id, 0) + 1
+
+    def get_liked_category_version(self, user_id: int) -> int:
+        """Gets version of liked categories for `user_id`."""
+        return UserDataVersionRepository.__liked_category_versions.get(user_id, 0)
+
+    def increment_liked_category_version(self, user_id: int) -> None:
+        """Increments version of liked categories for `user_id`, called every time the user likes or removes a category."""
+        with UserDataVersionRepository.__lock:
+            versions = UserDataVersionRepository.__liked_category_versions
+            versions[user_id] = versions.get(user_id, 0) + 1
@@ -1,75 +1,128 @@
-from scipy.sparse import csr_matrix, load_npz, save_npz
-from utils import BOOKS_DATA_USER_FEATURES
+import os
+from threading import Lock
+import numpy as np
+from scipy.sparse import csr_matrix, load_npz
+from utils import BOOKS_DATA_USER_FEATURES, BOOKS_DATA_USER_FEATURES_LOG
 from scipy.sparse import hstack, identity, vstack
 
 
+def load_added_user_ids(log_path: str | os.PathLike) -> list[int]:
+    """
+    Reads the ids of added users from the log, each line is the id of a user, in the order users were added.
+    A last line without newline is an interrupted append, it is truncated so the next append starts a new line.
+
+    Args:
+        log_path (str | os.PathLike): Path of the log, may not exist.
+
+    Returns:
+        list[int]: Empty if nothing was added.
+    """
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, 'r+') as file:
+        content = file.read()
+        complete_length = content.rfind('\n') + 1
+        if complete_length < len(content):
+            file.truncate(complete_length)
+    return [int(line) for line in content[:complete_length].split()]
+
+
 class UserFeaturesRepository:
 
-    __features = csr_matrix(load_npz(BOOKS_DATA_USER_FEATURES))
+    # user features are [common features, unique features], unique features are an identity block, one column for each user,
+    # therefore only the common features of users of the base file are stored and added users are a list of ids.
+    # Users of the base file have unique feature i = user id, added users have the next unique feature when they are added,
+    # therefore rows are only allocated for users that train, whatever the gaps between user ids
+    __base_features = csr_matrix(load_npz(BOOKS_DATA_USER_FEATURES))
+    __nr_base_users = __base_features.shape[0]
+    __nr_common_features = __base_features.shape[1] - __nr_base_users
+    __common_features = __base_features[:, :__nr_common_features]
+    __dtype = __base_features.dtype
+    del __base_features
+    # unique feature of the user at index i is __nr_base_users + i
+    __added_user_ids: list[int] = load_added_user_ids(BOOKS_DATA_USER_FEATURES_LOG)
+    __unique_features_by_user_id: dict[int, int] = {
+        user_id: __nr_base_users + i for i, user_id in enumerate(__added_user_ids)}
+    __lock = Lock()
 
     def __init__(self):
         """No attributes."""
 
     def get_user_features(self) -> csr_matrix:
-        """Gets user features."""
-        return UserFeaturesRepository.__features
+        """Builds user features of all users, O(number of users), use get_unique_user_feature for a single user."""
+        nr_users = self.get_nr_users()
+        # users added after the base file have no common features
+        common_features = vstack([UserFeaturesRepository.__common_features,
+                                  csr_matrix((nr_users - UserFeaturesRepository.__nr_base_users,
+                                              UserFeaturesRepository.__nr_common_features), dtype=UserFeaturesRepository.__dtype)])
+        return csr_matrix(hstack([common_features, identity(nr_users, dtype=UserFeaturesRepository.__dtype)]))
 
-    def set_user_features(self, features: csr_matrix) -> None:
-        "Sets and saves user features."
-        UserFeaturesRepository.__features = features
-        save_npz(BOOKS_DATA_USER_FEATURES, self.__features)
+    def find_unique_feature(self, user_id: int) -> int | None:
+        """
+        Finds the unique feature of `user_id` among unique features, the column of user features is
+        get_nr_common_features() + unique feature, it is also the row of user arrays of the model.
 
-    def get_nr_users(self) -> int:
-        """Gets nr of users from features."""
-        return UserFeaturesRepository.__features.shape[0]
+        Args:
+            user_id (int): User id.
 
-    def get_nr_features(self) -> int:
-        """Gets nr of user features from features."""
-        return UserFeaturesRepository.__features.shape[1]
+        Returns:
+            int | None: None if user isn't added.
+        """
+        if 0 <= user_id < UserFeaturesRepository.__nr_base_users:
+            return user_id
+        return UserFeaturesRepository.__unique_features_by_user_id.get(user_id)
 
-    def get_nr_common_features(self) -> int:
-        """Get number of common features from features."""
-        #each user has 1 unique feature
-        #therefore by subtracting nr user from features results in number of common features
-        return self.get_nr_features() - self.get_nr_users()
-    
-    def get_nr_user_features_to_add(self, user_id: int) -> None:
+    def get_unique_user_feature(self, user_id: int) -> csr_matrix:
         """
-        Gets number of user features to add for each new user by computing the distance between `user_id` and (size - 1) from user count in features.
+        Gets the unique features of `user_id` without building the user features.
 
         Args:
             user_id (int): User id.
 
         Returns:
-            None.
+            csr_matrix: Single row with a column for each user, 1 in the column of the unique feature of `user_id`.
+
+        Raises:
+            ValueError: If user isn't added.
         """
-        # user_id starts count from 0 while nr_users starts from 1, therefore subtract 1 from nr_users
-        nr_features_to_add = user_id - (self.get_nr_users() - 1)
-        return nr_features_to_add
+        unique_feature = self.find_unique_feature(user_id)
+        if unique_feature is None:
+            raise ValueError(f"User with id {user_id} has no user features")
+        return csr_matrix((np.ones(1, dtype=UserFeaturesRepository.__dtype), ([0], [unique_feature])),
+                          shape=(1, self.get_nr_users()))
+
+    def get_nr_users(self) -> int:
+        """Gets nr of users from features."""
+        return UserFeaturesRepository.__nr_base_users + len(UserFeaturesRepository.__added_user_ids)
 
+    def get_nr_features(self) -> int:
+        """Gets nr of user features from features."""
+        return UserFeaturesRepository.__nr_common_features + self.get_nr_users()
+
+    def get_nr_common_features(self) -> int:
+        """Get number of common features from features."""
+        return UserFeaturesRepository.__nr_common_features
 
-    def add_new_user_features(self, nr_users_to_add: int) -> None:
+    def add_user(self, user_id: int) -> int:
         """
-        Creates new unique column for each new user in user_features and adds `nr_users_to_add` rows
-        where each user has 1 unique value in the new columns and saves the new user features.
+        Adds a unique feature for `user_id` if it has none, new users have no common features.
+        Appends the id to the log, the base features file isn't rewritten.
 
         Args:
-            nr_users_to_add (int): Number of users.
+            user_id (int): User id.
 
         Returns:
-            None.
+            int: Unique feature of the user, see find_unique_feature.
         """
-        # expand horizontally current user_features with 0 for each new user
-        user_features_hstack = hstack(
-            [self.get_user_features(), csr_matrix((self.get_nr_users(), nr_users_to_add))])
-        # identity matrix representing each new user unique feature
-        new_user_features = identity(nr_users_to_add)
-        # prepend 0 repeated by get_nr_user_features so new_user_features has same number of features + new features
-        new_user_features = hstack(
-            [csr_matrix((nr_users_to_add, self.get_nr_features())), new_user_features])
-        # append new user features as rows
-        new_user_features = vstack(
-            [user_features_hstack, new_user_features])
-        # ensure new features are csr_matrix by converting
-        new_user_features = csr_matrix(new_user_features)
-        self.set_user_features(new_user_features)
\ No newline at end of file
+        with UserFeaturesRepository.__lock:
+            unique_feature = self.find_unique_feature(user_id)
+            if unique_feature is not None:
+                return unique_feature
+            with open(BOOKS_DATA_USER_FEATURES_LOG, 'a') as file:
+                file.write(f'{user_id}\n')
+                file.flush()
+                os.fsync(file.fileno())
+            unique_feature = self.get_nr_users()
+            UserFeaturesRepository.__added_user_ids.append(user_id)
+            UserFeaturesRepository.__unique_features_by_user_id[user_id] = unique_feature
+            return unique_feature
@@ -3,6 +3,8 @@ from db_models.book_rating import BookRating
 from dtos.book_ratings.post_book_rating_dto import PostBookRatingDto
 from repositories.book_rating_repository import BookRatingRepository
 from repositories.book_repository import BookRepository
+from repositories.training_status_cache_repository import TrainingStatusCacheRepository
+from repositories.user_data_version_repository import UserDataVersionRepository
 
 
 class BookRatingError(Exception):
@@ -22,6 +24,8 @@ class BookRatingService:
     def __init__(self, scoped_session: scoped_session):
         self.book_rating_repository = BookRatingRepository(scoped_session)
         self.book_repository = BookRepository(scoped_session)
+        self.user_data_version_repository = UserDataVersionRepository()
+        self.training_status_cache_repository = TrainingStatusCacheRepository()
 
     def rate(self, dto: PostBookRatingDto) -> None:
         """
@@ -55,4 +59,7 @@ class BookRatingService:
             self.book_rating_repository.update(model)
         # model is not none, rating is none -> delete model
         else:
-            self.book_rating_repository.delete(model)
\ No newline at end of file
+            self.book_rating_repository.delete(model)
+        # invalidates cached data computed from user ratings
+        self.user_data_version_repository.increment_rating_version(dto.user_id)
+        self.training_status_cache_repository.invalidate(dto.user_id)
\ No newline at end of file
@@ -4,22 +4,34 @@ import numpy as np
 from sqlalchemy.orm.scoping import scoped_session
 from custom_precision_at_k import custom_precision_at_k
 from db_models.book import Book
+from fast_precision_at_k import precision_at_k, sampled_precision_at_k
 from dtos.book_recommenders.by_id_dto import ByIdDto
 from dtos.book_recommenders.get_book_dto import GetBookDto
 from dtos.book_recommenders.by_content_dto import ByContentDto
-from dtos.book_recommenders.training_status_dto import TrainingStatus, TrainingStatusDto
-from repositories.book_image_repository import BookImageRepository
+from dtos.book_recommenders.by_contents_dto import ByContentsDto
+from dtos.book_recommenders.by_ids_dto import ByIdsDto
+from dtos.book_recommenders.training_status_dto import TrainingProgressStatus, TrainingStatus, TrainingStatusDto
+from dtos.book_recommenders.cache_stats_dto import CacheStatsDto
+from model_snapshot import ModelSnapshot
 from repositories.book_repository import BookRepository
 from repositories.item_features_repository import ItemFeaturesRepository
 from repositories.lightfm_repository import LightfmRepository
+from repositories.recommendation_cache_repository import RecommendationCacheRepository
+from repositories.training_status_cache_repository import TrainingStatusCacheRepository
+from repositories.user_data_version_repository import UserDataVersionRepository
 from repositories.user_repository import UserRepository
-from scipy.sparse import csr_matrix
-from threading import Thread, Event
+from scipy.sparse import csr_matrix, hstack, vstack
+from threading import Lock
+from services.book_service import BookService
 from services.item_preprocessing_service import ItemPreprocessingService
 from services.lightfm_service import LightfmService
 from services.nearest_neighbors_service import NearestNeighborsService
 from services.user_preprocessing_service import UserPreprocessingService
-from readerwriterlock.rwlock import RWLockWrite
+from progress_channel import ProgressChannel
+from thread_budget import thread_budget
+from training_budget import BudgetStopReason, TrainingBudget
+from training_scheduler import TrainingScheduler
+import utils
 
 
 class BookRecommenderError(Exception):
@@ -35,26 +47,65 @@ class BookRecommenderError(Exception):
         return (self.message, self.code)
 
 
+class TrainingJob:
+    """Data of a queued training, read from the database when the user is queued."""
+
+    def __init__(self, user_id: int, channel: ProgressChannel, nr_positive_ratings: int,
+                 y: csr_matrix, user_feature: csr_matrix):
+        self.user_id = user_id
+        self.channel = channel
+        self.nr_positive_ratings = nr_positive_ratings
+        self.y = y
+        self.user_feature = user_feature
+
+
 class BookRecommenderService:
 
-    __LOCK = RWLockWrite()
+    # serializes writers, readers take no lock, they get a snapshot once and use it until they finish
+    __WRITE_LOCK = Lock()
 
     __MINIMUM_POSITIVE_RATINGS: int = 8
     __BELOW_PRECISION_THRESHOLD: float = 0.3
     __MAX_PRECISION: float = 0.5
-
-    __curent_user_training_id: int = -1
-    __current_user_training_progress: int = -1
-    __event_training_progress_changed = Event()
-    __event_training_progress_stop = Event()
-
-    __is_training = False
+    # if set, precision of a user is first estimated from this many sampled books, all books are scored only if
+    # the confidence interval of the estimate contains a precision threshold
+    PRECISION_SAMPLES: int | None = None
+
+    # batches of trainings running at the same time, each one is a background job of thread_budget
+    MAX_CONCURRENT_TRAININGS: int = 2
+    MAX_QUEUED_TRAININGS: int = 50
+    # queued users trained together by a single model, item side cost of each epoch is paid once for the batch
+    MAX_TRAINING_BATCH_SIZE: int = 8
+    # only user arrays are trained, item arrays are shared with the model instead of copied and the neighbors index stays valid
+    FREEZE_ITEMS_DURING_TRAINING: bool = True
+    # users are folded in before training, if False training is skipped
+    REFINE_FOLD_IN_WITH_TRAINING: bool = True
+
+    # limits of a training batch, see TrainingBudget
+    TRAINING_MAX_SECONDS: float = 300
+    TRAINING_MAX_EPOCHS: int = 2000
+    TRAINING_PATIENCE: int = 3
+
+    # user id -> progress channel of queued or running training, messages are {'percentage', 'queue_position', 'status'}
+    __training_channels: dict[int, ProgressChannel] = {}
+    # user id -> closed progress channel of the last training, kept until the next training of the user replaces it,
+    # therefore a client that subscribes after a short training ended still gets its last message
+    __finished_training_channels: dict[int, ProgressChannel] = {}
+    # jobs run after the request that queued them ended, therefore without a database session
+    __training_scheduler = TrainingScheduler(
+        lambda jobs: BookRecommenderService(None).__train_on_users(jobs),
+        MAX_CONCURRENT_TRAININGS, MAX_QUEUED_TRAININGS, MAX_TRAINING_BATCH_SIZE,
+        on_queue_changed=lambda: BookRecommenderService.__publish_queue_positions())
+    thread_budget.reserve_background_jobs(__training_scheduler.max_concurrent_jobs)
 
     def __init__(self, scoped_session: scoped_session):
         self.book_repository = BookRepository(scoped_session)
         self.user_repository = UserRepository(scoped_session)
         self.lightfm_repository = LightfmRepository()
         self.item_features_repository = ItemFeaturesRepository()
+        self.recommendation_cache_repository = RecommendationCacheRepository()
+        self.user_data_version_repository = UserDataVersionRepository()
+        self.training_status_cache_repository = TrainingStatusCacheRepository()
 
         self.lightfm_service = LightfmService(scoped_session)
         self.item_preprocessing_service = ItemPreprocessingService(
@@ -77,9 +128,14 @@ class BookRecommenderService:
         Raises:
             BookRecommenderError: If `dto.book_id` doesn't exist.
         """
-        with BookRecommenderService.__LOCK.gen_rlock():
+        snapshot = self.lightfm_repository.get_snapshot()
+        key = ('by_id', snapshot.item_version, dto.book_id)
+        ids = self.recommendation_cache_repository.get(key)
+        if ids is None:
             ids = self.nearest_neighbors_service.find_nearest_neighbors_by_id(
-                dto.book_id)
+                dto.book_id, snapshot)
+            if ids is not None:
+                self.recommendation_cache_repository.set(key, ids)
         if ids is None:
             raise BookRecommenderError(
                 {'id': f"* Book with id {dto.book_id} doesn't exist"}, 400)
@@ -102,9 +158,14 @@ class BookRecommenderService:
         Returns:
             list[GetBookDto].
         """
-        with BookRecommenderService.__LOCK.gen_rlock():
+        snapshot = self.lightfm_repository.get_snapshot()
+        key = ('by_content', snapshot.item_version, dto.content,
+               tuple(dto.categories), tuple(dto.authors))
+        ids = self.recommendation_cache_repository.get(key)
+        if ids is None:
             ids = self.nearest_neighbors_service.get_nearest_neighbors_by_content(
-                dto.content, dto.categories, dto.authors)
+                dto.content, dto.categories, dto.authors, snapshot)
+            self.recommendation_cache_repository.set(key, ids)
         if dto.user_id is not None:
             models = self.book_repository.find_by_ids_with_categories_authors_rating(
                 ids, dto.user_id)
@@ -114,6 +175,69 @@ class BookRecommenderService:
         dtos = [self.map_model_to_get_dto(model) for model in models]
         return dtos
 
+    def get_recommendations_by_ids(self, dto: ByIdsDto) -> list[list[GetBookDto]]:
+        """
+        Gets book recommendations for many books by id, with a single neighbors search and a single fetch of books.
+
+        Args:
+            dto (ByIdsDto).
+
+        Returns:
+            list[list[GetBookDto]]: Element i contains recommendations for `dto.book_ids[i]`.
+
+        Raises:
+            BookRecommenderError: If any id in `dto.book_ids` doesn't exist.
+        """
+        nr_items = self.item_features_repository.get_nr_items()
+        invalid_ids = [str(id) for id in dto.book_ids if id < 0 or id >= nr_items]
+        if len(invalid_ids) > 0:
+            raise BookRecommenderError(
+                {'ids': f"* Books with ids {', '.join(invalid_ids)} don't exist"}, 400)
+        snapshot = self.lightfm_repository.get_snapshot()
+        keys = [('by_id', snapshot.item_version, book_id) for book_id in dto.book_ids]
+        ids_per_seed = [
+            self.recommendation_cache_repository.get(key) for key in keys]
+        missing = [i for i, ids in enumerate(ids_per_seed) if ids is None]
+        if len(missing) > 0:
+            neighbors = self.nearest_neighbors_service.find_nearest_neighbors_by_ids(
+                [dto.book_ids[i] for i in missing], snapshot)
+            for i, ids in zip(missing, neighbors):
+                # approximate search marks missing neighbors with -1
+                ids = ids[ids >= 0]
+                ids_per_seed[i] = ids
+                self.recommendation_cache_repository.set(keys[i], ids)
+        return self.__find_books_for_each_seed(ids_per_seed, dto.user_id)
+
+    def get_recommendations_by_contents(self, dto: ByContentsDto) -> list[list[GetBookDto]]:
+        """
+        Gets book recommendations for many contents, with a single neighbors search and a single fetch of books.
+
+        Args:
+            dto (ByContentsDto).
+
+        Returns:
+            list[list[GetBookDto]]: Element i contains recommendations for `dto.contents[i]`.
+        """
+        snapshot = self.lightfm_repository.get_snapshot()
+        keys = [('by_content', snapshot.item_version, content.content, tuple(content.categories), tuple(content.authors))
+                for content in dto.contents]
+        ids_per_seed = [
+            self.recommendation_cache_repository.get(key) for key in keys]
+        missing = [i for i, ids in enumerate(ids_per_seed) if ids is None]
+        if len(missing) > 0:
+            missing_contents = [dto.contents[i] for i in missing]
+            neighbors = self.nearest_neighbors_service.get_nearest_neighbors_by_contents(
+                [content.content for content in missing_contents],
+                [content.categories for content in missing_contents],
+                [content.authors for content in missing_contents],
+                snapshot)
+            for i, ids in zip(missing, neighbors):
+                # approximate search marks missing neighbors with -1
+                ids = ids[ids >= 0]
+                ids_per_seed[i] = ids
+                self.recommendation_cache_repository.set(keys[i], ids)
+        return self.__find_books_for_each_seed(ids_per_seed, dto.user_id)
+
     def get_recommendations_by_user(self, id: int) -> list[GetBookDto]:
         """
         Gets book recommendations by user with `id`.
@@ -124,14 +248,34 @@ class BookRecommenderService:
         Returns:
             list[GetBookDto].
         """
-        predictions, book_indices = self.__predict_single_user(id)
-        indices_sorted = np.argsort(-predictions)
-        top_book_indices = book_indices[indices_sorted[:100]]
+        # rating and liked category versions are read before predicting, therefore if they change
+        # while predicting, the result is cached under the old versions and never read
+        snapshot = self.lightfm_repository.get_snapshot()
+        key = ('by_user', snapshot.version, id,
+               self.user_data_version_repository.get_rating_version(id),
+               self.user_data_version_repository.get_liked_category_version(id))
+        top_book_indices = self.recommendation_cache_repository.get(key)
+        if top_book_indices is None:
+            predictions, rated_mask = self.__predict_single_user(id, snapshot)
+            # rated books have -inf prediction, they are only taken if there are less than 100 not rated books
+            top_book_indices = utils.top_k_indices(predictions, 100)
+            top_book_indices = top_book_indices[rated_mask[top_book_indices] == False]
+            self.recommendation_cache_repository.set(key, top_book_indices)
         predicted_books = self.book_repository.find_by_ids_with_categories_authors_rating(
             top_book_indices, id)
         dtos = [self.map_model_to_get_dto(book) for book in predicted_books]
         return dtos
 
+    def get_cache_stats(self) -> CacheStatsDto:
+        """
+        Gets counters of the recommendation cache.
+
+        Returns:
+            CacheStatsDto.
+        """
+        stats = self.recommendation_cache_repository.get_stats()
+        return CacheStatsDto(**stats)
+
     def validate_can_train(self, user_id: int) -> TrainingStatusDto:
         """
         Validates if user can train.
@@ -142,26 +286,11 @@ class BookRecommenderService:
         Returns:
             TrainingStatusDto.
         """
-        with BookRecommenderService.__LOCK.gen_rlock():
-            dto = self.__validate_current_user_training(user_id)
-            if dto is not None:
-                return dto
-    
-            positive_book_ratings = self.user_repository.find_liked_books(
-                user_id)
-            
-            dto = self.__validate_minimum_positive_ratings(positive_book_ratings)
-            if dto is not None:
-                return dto
-            
-            if self.lightfm_service.is_user_added(user_id) == False:
-                return TrainingStatusDto(TrainingStatus.MUST_TRAIN, "")
-        
-        # in some cases, user embeddings are discarded, therefore, add them
-        with BookRecommenderService.__LOCK.gen_wlock():
-            self.lightfm_service.add_user_embeddings_if_feature_mismatch()
+        dto = self.__validate_current_user_training(user_id)
+        if dto is not None:
+            return dto
 
-        return self.__validate_precision(user_id, positive_book_ratings)
+        return self.__get_user_status(user_id)
 
     def validate_can_get_recommendations(self, user_id: int) -> TrainingStatusDto:
         """
@@ -173,75 +302,94 @@ class BookRecommenderService:
         Returns:
             TrainingStatusDto.
         """
-        with BookRecommenderService.__LOCK.gen_rlock():
-            positive_book_ratings = self.user_repository.find_liked_books(
-                user_id)
-            
-            dto = self.__validate_minimum_positive_ratings(positive_book_ratings)
-            if dto is not None:
-                return dto
-            
-            if self.lightfm_service.is_user_added(user_id) == False:
-                return TrainingStatusDto(TrainingStatus.MUST_TRAIN, "")
-            
-        # in some cases, user embeddings are discarded, therefore, add them
-        with BookRecommenderService.__LOCK.gen_wlock():
-            self.lightfm_service.add_user_embeddings_if_feature_mismatch()
+        return self.__get_user_status(user_id)
 
-        return self.__validate_precision(user_id, positive_book_ratings)
-
-    def train_on_single_user(self, user_id: int) -> None:
+    def train_on_single_user(self, user_id: int) -> bool:
         """
-        Trains the model on a single user by creating a new model and transfering the data.
+        Folds in the user in closed form, therefore recommendations are available right away, then queues training of the model
+        on the user as a refinement if REFINE_FOLD_IN_WITH_TRAINING. When the training starts, it creates a new model from the current one
+        and transfers the data when it finishes. Users queued at the same time are trained together in batches of at most
+        MAX_TRAINING_BATCH_SIZE, at most MAX_CONCURRENT_TRAININGS batches train at the same time.
 
         Args:
             user_id (int): User id.
 
         Returns:
-            None.
+            bool: False if user is already queued or training or too many users are queued.
         """
-        with BookRecommenderService.__LOCK.gen_wlock():
-            BookRecommenderService.__is_training = True
-            BookRecommenderService.__curent_user_training_id = user_id
+        with BookRecommenderService.__WRITE_LOCK:
+            if BookRecommenderService.__training_scheduler.is_scheduled(user_id):
+                return False
 
             self.lightfm_service.add_new_users(user_id)
             self.lightfm_service.reset_user_gradients(user_id)
 
             user_feature = self.user_preprocessing_service.get_transformed_categories_by_user_id_with_unique_feature(
                 user_id)
-            item_features = self.item_features_repository.get_item_features()
-
-            single_user_model = self.lightfm_repository.new_model_with_single_user(
-                user_feature, self.lightfm_repository.get_model())
 
             positive_book_ratings = self.user_repository.find_liked_books(
                 user_id)
             y = self.item_preprocessing_service.convert_positive_book_ratings_to_csr(
                 positive_book_ratings)
 
-        thread_args = (single_user_model,
-                       len(positive_book_ratings),
-                       y,
-                       item_features,
-                       user_feature)
-
-        Thread(target=self.__train_on_single_user, args=thread_args).start()
-
-    def get_training_progress(self):
+            snapshot = self.lightfm_service.fold_in_user(
+                user_id, user_feature, [book.id for book in positive_book_ratings])
+            self.lightfm_repository.publish_snapshot(snapshot)
+            # statuses are keyed by model version, therefore every cached one is stale
+            self.training_status_cache_repository.clear()
+            self.lightfm_repository.save_model()
+            if BookRecommenderService.REFINE_FOLD_IN_WITH_TRAINING == False:
+                # nothing is queued, watchers get the single message of a training that already finished
+                channel = ProgressChannel()
+                BookRecommenderService.__publish_progress(
+                    channel, 100, 0, TrainingProgressStatus.FINISHED)
+                channel.close()
+                BookRecommenderService.__finished_training_channels[user_id] = channel
+                return True
+
+            channel = ProgressChannel()
+            BookRecommenderService.__finished_training_channels.pop(user_id, None)
+            BookRecommenderService.__training_channels[user_id] = channel
+            # database is only read here, the job runs after the request ends
+            job = TrainingJob(user_id, channel, len(
+                positive_book_ratings), y, user_feature)
+            if BookRecommenderService.__training_scheduler.submit(user_id, job) == False:
+                del BookRecommenderService.__training_channels[user_id]
+                return False
+        BookRecommenderService.__publish_queue_positions()
+        return True
+
+    def is_training_scheduled(self, user_id: int) -> bool:
+        """Returns True if training of user is queued or running."""
+        return BookRecommenderService.__training_scheduler.is_scheduled(user_id)
+
+    def get_training_progress(self, user_id: int):
         """
-        Awaits and yields training progress when it is changed.
+        Awaits and yields training progress of user when it is changed, including its position in the training queue.
+        Any number of watchers can follow the same training, a watcher that reads slowly only skips old progress.
+        If the training already ended, yields its last progress.
+
+        Args:
+            user_id (int): User id.
         """
-        while BookRecommenderService.__curent_user_training_id != -1:
-            BookRecommenderService.__event_training_progress_changed.wait()
-            v = {'percentage': BookRecommenderService.__current_user_training_progress}
-            res = json.dumps(v) + '\n'
-            yield res
-            BookRecommenderService.__event_training_progress_changed.clear()
-        BookRecommenderService.__event_training_progress_stop.set()
+        channel = BookRecommenderService.__training_channels.get(user_id)
+        if channel is None:
+            channel = BookRecommenderService.__finished_training_channels.get(user_id)
+        if channel is None:
+            return
+        subscription = channel.subscribe()
+        try:
+            for v in subscription:
+                res = json.dumps(v) + '\n'
+                yield res
+        finally:
+            # runs when the client disconnects too
+            subscription.unsubscribe()
 
     @staticmethod
     def map_model_to_get_dto(model: Book) -> GetBookDto:
-        image = BookImageRepository.convert_image_base64(model.image_link)
+        image = BookService.get_image(model.image_link)
+        image_url = BookService.get_image_url(model.id, model.image_link)
         rating = model.ratings[0].rating if len(model.ratings) > 0 else None
         categories = [category.name for category in model.categories]
         authors = {author.author.name: author.role for author in model.authors}
@@ -251,6 +399,7 @@ class BookRecommenderService:
                           model.description,
                           model.link,
                           image,
+                          image_url,
                           model.nr_likes,
                           model.nr_dislikes,
                           categories,
@@ -258,85 +407,215 @@ class BookRecommenderService:
                           rating
                           )
 
-    def __compute_user_precision(self, model: LightFM, nr_positive_ratings: int,
-                                 y: csr_matrix, item_features: csr_matrix, user_features: csr_matrix):
+    def __find_books_for_each_seed(self, ids_per_seed: list[np.ndarray], user_id: int | None) -> list[list[GetBookDto]]:
         """
-        Computes custom_precision_at_k for top `nr_positive_ratings`.
+        Fetches the union of `ids_per_seed` with a single query and maps them back to each seed.
+
+        Args:
+            ids_per_seed (list[np.ndarray]): Book ids to fetch for each seed.
+            user_id (int | None): If not None, also fetches rating of this user.
+
+        Returns:
+            list[list[GetBookDto]]: Element i contains books with ids from `ids_per_seed[i]` in the same order.
+        """
+        all_ids = np.unique(np.concatenate(ids_per_seed)).tolist()
+        if user_id is not None:
+            models = self.book_repository.find_by_ids_with_categories_authors_rating(
+                all_ids, user_id)
+        else:
+            models = self.book_repository.find_by_ids_with_categories_authors(
+                all_ids)
+        dtos_by_id = {model.id: self.map_model_to_get_dto(model)
+                      for model in models}
+        return [[dtos_by_id[id] for id in ids.tolist() if id in dtos_by_id] for ids in ids_per_seed]
+
+    def __compute_users_precision(self, model: LightFM, nr_positive_ratings: int | np.ndarray,
+                                  y: csr_matrix, item_features: csr_matrix, user_features: csr_matrix,
+                                  num_threads: int) -> np.ndarray:
+        """
+        Computes custom_precision_at_k for top `nr_positive_ratings` of each row of `y`.
+
+        Returns:
+            np.ndarray: Single dimensional array, precision of each user.
         """
-        # k = nr_positive_ratings because precision is computed for all items here
+        # k = nr_positive_ratings because precision is computed for all items here, custom_precision_at_k clips
+        # the number of positives of each row to k, therefore k can contain a value for each row
         return custom_precision_at_k(model, y, item_features=item_features, user_features=user_features,
-                                     k=nr_positive_ratings, num_threads=12).mean()
+                                     k=nr_positive_ratings, num_threads=num_threads)
 
-    def __get_all_book_indices_not_rated(self, user_id: int) -> np.ndarray:
+    def __get_rated_books_mask(self, user_id: int) -> np.ndarray:
         """
-        Gets all book indices/ids that are not rated by user.
+        Gets a mask over all book indices/ids where books rated by user are True.
 
         Args:
             user_id (int): User id.
 
         Returns:
-            np.ndarray: Single dimensional array.
+            np.ndarray: Single dimensional boolean array.
         """
-        book_indices = np.arange(self.item_features_repository.get_nr_items())
+        mask = np.zeros(self.item_features_repository.get_nr_items(), dtype=bool)
         rated_books = self.user_repository.find_rated_books(user_id)
-        rated_ids = [book.id for book in rated_books]
-        return book_indices[np.isin(book_indices, rated_ids) == False]
+        mask[[book.id for book in rated_books]] = True
+        return mask
 
-    def __train_on_single_user(self, model: LightFM, nr_positive_ratings: int,
-                               y: csr_matrix, item_features: csr_matrix, user_feature: csr_matrix):
+    def __train_on_users(self, jobs: list[TrainingJob]):
         """
-        Trains on single user.
+        Trains queued users together with a single model, runs on a worker thread of the training scheduler.
+        Users stop being trained when they reach the precision threshold, the batch ends when all of them reached it or
+        when its TrainingBudget stops it, the model trained so far is transfered either way.
 
         Args:
-            model (LightFM): LightFM model with features for only 1 user.
-            nr_positive_ratings (int): Number of positive ratings.
-            y (csr_matrix): Single row csr matrix representing target predictions.
-            item_features (csr_matrix): All item features.
-            user_feature (csr_matrix): Single row csr_matrix representing features for that user.
-        """
-
-        user_feature_ones = csr_matrix(user_feature.data)
-        max_percentage = 0
-
-        BookRecommenderService.__current_user_training_progress = max_percentage
-        BookRecommenderService.__event_training_progress_changed.set()
-
-        while True:
-            model.fit_partial(y, item_features=item_features,
-                              user_features=user_feature_ones, epochs=200, num_threads=12)
-            precision = self.__compute_user_precision(model, nr_positive_ratings,
-                                                      y, item_features, user_feature_ones)
-            percentage = round(
-                precision / BookRecommenderService.__BELOW_PRECISION_THRESHOLD, 2)
-            # percentage must take values from 0 to 1 only
-            percentage = min(1, percentage)
-            if percentage > max_percentage:
-                BookRecommenderService.__current_user_training_progress = percentage
-                BookRecommenderService.__event_training_progress_changed.set()
-            if precision >= BookRecommenderService.__BELOW_PRECISION_THRESHOLD:
-                break
-
-        BookRecommenderService.__curent_user_training_id = -1
-        BookRecommenderService.__event_training_progress_changed.set()
-        # wait for progress to be displayed then continue
-        BookRecommenderService.__event_training_progress_stop.wait()
-        BookRecommenderService.__current_user_training_progress = -1
-        BookRecommenderService.__event_training_progress_stop.clear()
-
-        with BookRecommenderService.__LOCK.gen_wlock():
+            jobs (list[TrainingJob]): Queued trainings, in queue order.
+        """
+        try:
+            item_features = self.item_features_repository.get_item_features()
+            # users queued earlier have less features, new features are 0 for them
+            nr_features = max(job.user_feature.shape[1] for job in jobs)
+            user_features = vstack([hstack([job.user_feature, csr_matrix((1, nr_features - job.user_feature.shape[1]))])
+                                    for job in jobs]).tocsr()
+            y = vstack([job.y for job in jobs]).tocsr()
+            nr_positive_ratings = np.array(
+                [job.nr_positive_ratings for job in jobs])
+
+            # item arrays of a snapshot are never modified, therefore base_model keeps the arrays training started from
             base_model = self.lightfm_repository.get_model()
-            LightfmRepository.transfer_data_from_new_model_to_model(
-                model, base_model, user_feature)
-            self.nearest_neighbors_service.refit_neighbors()
-            self.lightfm_repository.save_model()
-            BookRecommenderService.__is_training = False
+            freeze_items = BookRecommenderService.FREEZE_ITEMS_DURING_TRAINING and \
+                LightfmRepository.can_freeze_items(base_model)
+            model = self.lightfm_repository.new_model_with_users(
+                user_features, base_model, freeze_items)
+            # column i is feature i of model
+            model_user_features = user_features[:, LightfmRepository.get_feature_indices(
+                user_features)]
+
+            max_percentages = np.zeros(len(jobs))
+            # percentage of each user measured by the last check, budget uses their mean as progress
+            percentages = np.zeros(len(jobs))
+            for job in jobs:
+                BookRecommenderService.__publish_progress(
+                    job.channel, 0, 0, TrainingProgressStatus.TRAINING)
+
+            budget = TrainingBudget(max_seconds=BookRecommenderService.TRAINING_MAX_SECONDS,
+                                    max_epochs=BookRecommenderService.TRAINING_MAX_EPOCHS,
+                                    patience=BookRecommenderService.TRAINING_PATIENCE)
+            num_threads = thread_budget.get_job_threads()
+            is_training = np.ones(len(jobs), dtype=bool)
+            while is_training.any():
+                epochs = budget.next_epochs()
+                if epochs == 0:
+                    break
+                rows = np.flatnonzero(is_training)
+                model.fit_partial(y[rows], item_features=item_features,
+                                  user_features=model_user_features[rows], epochs=epochs,
+                                  num_threads=num_threads)
+                precisions = self.__compute_users_precision(model, nr_positive_ratings[rows], y[rows], item_features,
+                                                            model_user_features[rows],
+                                                            num_threads=num_threads)
+                for row, precision in zip(rows, precisions):
+                    percentage = round(
+                        precision / BookRecommenderService.__BELOW_PRECISION_THRESHOLD, 2)
+                    # percentage must take values from 0 to 1 only
+                    percentage = min(1, percentage)
+                    percentages[row] = percentage
+                    if percentage > max_percentages[row]:
+                        max_percentages[row] = percentage
+                        BookRecommenderService.__publish_progress(
+                            jobs[row].channel, percentage, 0, TrainingProgressStatus.TRAINING)
+                    if precision >= BookRecommenderService.__BELOW_PRECISION_THRESHOLD:
+                        is_training[row] = False
+                budget.record(epochs, percentages.mean())
+
+            if budget.get_stop_reason() == BudgetStopReason.PLATEAU:
+                stopped_status = TrainingProgressStatus.PLATEAU
+            else:
+                stopped_status = TrainingProgressStatus.BUDGET_EXHAUSTED
+
+            # batches that finish at the same time are transfered one by one, readers keep using the current snapshot
+            # while the next one is built, it is published with a single assignment
+            with BookRecommenderService.__WRITE_LOCK:
+                base_snapshot = self.lightfm_repository.get_snapshot()
+                snapshot = self.lightfm_repository.new_snapshot_with_trained_users(
+                    model, user_features, base_model, transfer_items=freeze_items == False)
+                self.lightfm_service.get_item_representations(snapshot)
+                # only items whose representation changed enough are updated in a copy of the index
+                self.nearest_neighbors_service.set_updated_index(
+                    snapshot, base_snapshot)
+                self.lightfm_repository.publish_snapshot(snapshot)
+                # statuses are keyed by model version, therefore every cached one is stale
+                self.training_status_cache_repository.clear()
+                # results cached by user are keyed by model version and are evicted as they are never read again,
+                # results cached by book or content stay valid if items didn't change
+                if snapshot.item_version != base_snapshot.item_version:
+                    self.recommendation_cache_repository.clear()
+                    self.nearest_neighbors_service.rebuild_neighbor_table_in_background(
+                        snapshot)
+                self.lightfm_repository.save_model()
+
+            for row, job in enumerate(jobs):
+                status = stopped_status if is_training[row] else TrainingProgressStatus.FINISHED
+                BookRecommenderService.__publish_progress(
+                    job.channel, max_percentages[row], 0, status)
+        finally:
+            # watchers stop after the trained model is published, recommendations they request next use it
+            for job in jobs:
+                job.channel.close()
+                BookRecommenderService.__finished_training_channels[job.user_id] = job.channel
+                BookRecommenderService.__training_channels.pop(
+                    job.user_id, None)
+
+    @staticmethod
+    def __publish_queue_positions() -> None:
+        """Publishes the queue position of every training that didn't start."""
+        for user_id, channel in list(BookRecommenderService.__training_channels.items()):
+            queue_position = BookRecommenderService.__training_scheduler.get_queue_position(
+                user_id)
+            if queue_position is not None and queue_position > 0:
+                BookRecommenderService.__publish_progress(
+                    channel, 0, queue_position, TrainingProgressStatus.QUEUED)
+
+    @staticmethod
+    def __publish_progress(channel: ProgressChannel, percentage: float, queue_position: int,
+                           status: TrainingProgressStatus) -> None:
+        channel.publish({'percentage': float(percentage), 'queue_position': queue_position,
+                         'status': status.name.lower()})
+
+    def __get_user_status(self, user_id: int) -> TrainingStatusDto:
+        """
+        Gets the status computed from the ratings and liked categories of the user and the model, memoized by their versions.
+        Versions are read before computing, therefore if they change meanwhile, the status is cached under the old versions and never read.
+        """
+        snapshot = self.lightfm_repository.get_snapshot()
+        key = (snapshot.version,
+               self.user_data_version_repository.get_rating_version(user_id),
+               self.user_data_version_repository.get_liked_category_version(user_id))
+        dto = self.training_status_cache_repository.get(user_id, key)
+        if dto is None:
+            dto = self.__compute_user_status(user_id)
+            self.training_status_cache_repository.set(user_id, key, dto)
+        return dto
+
+    def __compute_user_status(self, user_id: int) -> TrainingStatusDto:
+        positive_book_ratings = self.user_repository.find_liked_books(
+            user_id)
+
+        dto = self.__validate_minimum_positive_ratings(positive_book_ratings)
+        if dto is not None:
+            return dto
+
+        if self.lightfm_service.is_user_added(user_id) == False:
+            return TrainingStatusDto(TrainingStatus.MUST_TRAIN, "")
+
+        # in some cases, user embeddings are discarded, therefore, add them, the write lock is taken only if they are missing
+        if self.lightfm_service.has_user_embedding_feature_mismatch():
+            with BookRecommenderService.__WRITE_LOCK:
+                self.lightfm_service.add_user_embeddings_if_feature_mismatch()
+
+        return self.__validate_precision(user_id, positive_book_ratings)
 
     def __validate_current_user_training(self, user_id) -> TrainingStatusDto | None:
-        if BookRecommenderService.__is_training:
-            if BookRecommenderService.__curent_user_training_id == user_id:
-                return TrainingStatusDto(TrainingStatus.CURRENTLY_TRAINING_LOGGED_IN_USER, "")
-            else:
-                return TrainingStatusDto(TrainingStatus.CURRENTLY_TRAINING_OTHER_USER, "Currently training another user. Please wait a few minutes!")
+        if BookRecommenderService.__training_scheduler.is_scheduled(user_id):
+            return TrainingStatusDto(TrainingStatus.CURRENTLY_TRAINING_LOGGED_IN_USER, "")
+        if BookRecommenderService.__training_scheduler.is_full():
+            return TrainingStatusDto(TrainingStatus.CURRENTLY_TRAINING_OTHER_USER, "Too many users are training. Please wait a few minutes!")
         return None
 
     def __validate_minimum_positive_ratings(self, positive_book_ratings) -> TrainingStatusDto | None:
@@ -347,29 +626,53 @@ class BookRecommenderService:
         return None
 
     def __validate_precision(self, user_id, positive_book_ratings) -> TrainingStatusDto:
-        with BookRecommenderService.__LOCK.gen_rlock():
-            y = self.item_preprocessing_service.convert_positive_book_ratings_to_csr(
-                positive_book_ratings)
-            user_feature = self.user_preprocessing_service.get_transformed_categories_by_user_id_with_unique_feature(
-                user_id)
-            model = self.lightfm_repository.get_model()
-            item_features = self.item_features_repository.get_item_features()
-            precision = self.__compute_user_precision(
-                model, len(positive_book_ratings), y, item_features=item_features, user_features=user_feature)
+        y = self.item_preprocessing_service.convert_positive_book_ratings_to_csr(
+            positive_book_ratings)
+        user_feature = self.user_preprocessing_service.get_transformed_categories_by_user_id_with_unique_feature(
+            user_id)
+        snapshot = self.lightfm_repository.get_snapshot()
+        precision = self.__estimate_user_precision(
+            user_feature, y.indices, snapshot)
         if precision < BookRecommenderService.__BELOW_PRECISION_THRESHOLD:
             return TrainingStatusDto(TrainingStatus.MUST_TRAIN, "")
         if precision < BookRecommenderService.__MAX_PRECISION:
             return TrainingStatusDto(TrainingStatus.CAN_TRAIN, "")
         else:
             return TrainingStatusDto(TrainingStatus.ALREADY_TRAINED, "")
-        
-    def __predict_single_user(self, user_id):
-        with BookRecommenderService.__LOCK.gen_rlock():
-            item_features = self.item_features_repository.get_item_features()
-            user_feature = self.user_preprocessing_service.get_transformed_categories_by_user_id_with_unique_feature(
-                user_id)
-            book_indices = self.__get_all_book_indices_not_rated(user_id)
-            model = self.lightfm_repository.get_model()
-            predictions = model.predict(
-                0, book_indices, item_features=item_features, user_features=user_feature)
-        return predictions, book_indices
\ No newline at end of file
+
+    def __estimate_user_precision(self, user_feature: csr_matrix, positive_ids: np.ndarray, snapshot: ModelSnapshot) -> float:
+        """
+        Computes the same precision as __compute_users_precision for a single user, from the cached item representations of `snapshot`
+        instead of predict_rank.
+        """
+        user_representation = self.lightfm_service.get_user_representation(
+            user_feature, snapshot)
+        if BookRecommenderService.PRECISION_SAMPLES is not None:
+            estimate = sampled_precision_at_k(
+                lambda ids: self.lightfm_service.predict_scores_by_user_representation(
+                    user_representation, snapshot, ids),
+                self.lightfm_service.get_item_representations(snapshot).shape[0], positive_ids, nr_samples=BookRecommenderService.PRECISION_SAMPLES)
+            thresholds = [BookRecommenderService.__BELOW_PRECISION_THRESHOLD, BookRecommenderService.__MAX_PRECISION]
+            if all(threshold <= estimate.lower or estimate.upper < threshold for threshold in thresholds):
+                return estimate.precision
+        scores = self.lightfm_service.predict_scores_by_user_representation(
+            user_representation, snapshot)
+        return precision_at_k(scores, positive_ids)
+
+    def __predict_single_user(self, user_id, snapshot: ModelSnapshot) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Predicts scores of all books for user with the model of `snapshot`, rated books get -inf.
+
+        Returns:
+            np.ndarray: Single dimensional array of predictions, index is book id.
+            np.ndarray: Single dimensional boolean array, True where book is rated.
+        """
+        rated_mask = self.__get_rated_books_mask(user_id)
+        user_feature = self.user_preprocessing_service.get_transformed_categories_by_user_id_with_unique_feature(
+            user_id)
+        user_representation = self.lightfm_service.get_user_representation(
+            user_feature, snapshot)
+        predictions = self.lightfm_service.predict_scores_by_user_representation(
+            user_representation, snapshot)
+        predictions[rated_mask] = -np.inf
+        return predictions, rated_mask
\ No newline at end of file
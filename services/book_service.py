@@ -1,7 +1,12 @@
+from pathlib import Path
+from flask import current_app, url_for
 from sqlalchemy.orm.scoping import scoped_session
 from db_models.book import Book
 from dtos.books.get_book_id_title_dto import GetBookIdTitleDto
+from dtos.books.image_cache_stats_dto import ImageCacheStatsDto
+from dtos.books.image_variant_dto import ImageVariantDto
 from dtos.books.search_book_dto import SearchBookDto
+from repositories.book_image_repository import BookImageRepository
 from repositories.book_repository import BookRepository
 
 
@@ -24,6 +29,66 @@ class BookService:
         dtos = [self.map_model_to_id_title_dto(model) for model in models]
         return dtos
 
+    def find_image_path(self, id: int, dto: ImageVariantDto | None = None) -> Path | None:
+        """
+        Finds image filepath of book with `id`, or of its resized variant.
+
+        Args:
+            id (int): Book id.
+            dto (ImageVariantDto | None): Variant and format, the original image if None or `dto.variant` is None.
+
+        Returns:
+            Path | None: None if book doesn't exist or has no image.
+        """
+        model = self.book_repository.find_by_id(id)
+        if model is None:
+            return None
+        if dto is None or dto.variant is None:
+            return BookImageRepository.find_image_path(model.image_link)
+        return BookImageRepository.find_image_variant_path(model.image_link, dto.variant, dto.format)
+
+    def is_image_fallback(self, filepath: Path, dto: ImageVariantDto | None = None) -> bool:
+        """
+        Checks if `filepath` found by find_image_path is the original image served because its variant couldn't be written.
+
+        Args:
+            filepath (Path): Path returned by find_image_path.
+            dto (ImageVariantDto | None): Variant and format passed to find_image_path.
+
+        Returns:
+            bool: False if no variant was requested.
+        """
+        if dto is None or dto.variant is None:
+            return False
+        return BookImageRepository.is_image_variant_path(filepath) == False
+
+    def get_image_cache_stats(self) -> ImageCacheStatsDto:
+        """
+        Gets hit ratio, byte usage and load counters of the cache of images encoded in base64, used if INLINE_BOOK_IMAGES.
+
+        Returns:
+            ImageCacheStatsDto.
+        """
+        stats = BookImageRepository.get_cache_stats()
+        return ImageCacheStatsDto(**stats)
+
+    @staticmethod
+    def get_image(image_link: str | None) -> str | None:
+        """Gets image of book encoded in base64 if INLINE_BOOK_IMAGES is set in app config, otherwise None."""
+        if current_app.config.get('INLINE_BOOK_IMAGES', True):
+            return BookImageRepository.convert_image_base64(image_link)
+        return None
+
+    @staticmethod
+    def get_image_url(id: int, image_link: str | None) -> str | None:
+        """
+        Gets url of image of book with `id`, None if book has no image link. The file isn't checked, lists of books would
+        read the disk once for each book, the url responds 404 if the file doesn't exist. Must be called in a request.
+        """
+        if type(image_link) not in [str, Path]:
+            return None
+        return url_for('api.books.book_image', id=id)
+
     @staticmethod
     def map_model_to_id_title_dto(model: Book) -> GetBookIdTitleDto:
         return GetBookIdTitleDto(model.id, model.title)
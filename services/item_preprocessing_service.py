@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
 from sqlalchemy.orm.scoping import scoped_session
+from model_snapshot import ModelSnapshot
 from repositories.item_features_repository import ItemFeaturesRepository
 from repositories.item_preprocessing_repository import ItemPreprocessingRepository
 from services.lightfm_service import LightfmService
@@ -13,7 +14,8 @@ class ItemPreprocessingService:
         self.item_features_repository = ItemFeaturesRepository()
         self.lightfm_service = LightfmService(scoped_session)
 
-    def get_item_representation_by_content(self, content: str, categories: list, authors: list) -> np.ndarray:
+    def get_item_representation_by_content(self, content: str, categories: list, authors: list,
+                                           snapshot: ModelSnapshot | None = None) -> np.ndarray:
         """
         Gets item_representation by `content`, `categories` and `authors`. 
 
@@ -21,13 +23,30 @@ class ItemPreprocessingService:
             content (str): Book description.
             categories (list): Book categories.
             authors (list): Book authors.
+            snapshot (ModelSnapshot | None): Snapshot to read from, the current snapshot if None.
 
         Returns:
             np.ndarray (single dimensional array).
         """
 
-        transformed = self.__transform_and_expand(content, categories, authors)
-        return self.lightfm_service.get_item_representations_by_features(transformed)[0]
+        return self.get_item_representations_by_contents([content], [categories], [authors], snapshot)[0]
+
+    def get_item_representations_by_contents(self, contents: list[str], categories: list[list],
+                                             authors: list[list], snapshot: ModelSnapshot | None = None) -> np.ndarray:
+        """
+        Gets item_representations for many books at once, row i is built from `contents[i]`, `categories[i]` and `authors[i]`.
+
+        Args:
+            contents (list[str]): Book descriptions.
+            categories (list[list]): Categories of each book.
+            authors (list[list]): Authors of each book.
+            snapshot (ModelSnapshot | None): Snapshot to read from, the current snapshot if None.
+
+        Returns:
+            np.ndarray (two dimensional array).
+        """
+        transformed = self.__transform_and_expand(contents, categories, authors)
+        return self.lightfm_service.get_item_representations_by_features(transformed, snapshot)
     
     def convert_positive_book_ratings_to_csr(self, positive_book_ratings : list[int]) -> csr_matrix:
         """
@@ -49,20 +68,19 @@ class ItemPreprocessingService:
         return y
 
     
-    def __transform(self, content: str, categories: list[str], authors: list[str]) -> csr_matrix:
+    def __transform(self, contents: list[str], categories: list[list[str]], authors: list[list[str]]) -> csr_matrix:
         """
-        Transforms content, categories and authors to csr_matrix.
+        Transforms contents, categories and authors to csr_matrix, one row for each book.
         """
-        df = pd.DataFrame({'content': [content], 'categories': [
-            categories], 'authors': [authors]})
+        df = pd.DataFrame({'content': contents, 'categories': categories, 'authors': authors})
         preprocessing = self.item_preprocessing_repository.get_preprocessing()
         return preprocessing.transform(df)
 
-    def __transform_and_expand(self, content: str, categories: list[str], authors: list[str]) -> csr_matrix:
+    def __transform_and_expand(self, contents: list[str], categories: list[list[str]], authors: list[list[str]]) -> csr_matrix:
         """
-        Transforms content, categories and authors to csr_matrix and appends 0 until it has the same size as item features.
+        Transforms contents, categories and authors to csr_matrix and appends 0 until it has the same size as item features.
         """
-        v = self.__transform(content, categories, authors)
+        v = self.__transform(contents, categories, authors)
         nr_features = self.item_features_repository.get_nr_features()
         nr_zeros_to_add = nr_features -  v.shape[1]
         return hstack([v, csr_matrix((v.shape[0], nr_zeros_to_add))])
\ No newline at end of file
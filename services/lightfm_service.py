@@ -1,5 +1,6 @@
 import numpy as np
 from sqlalchemy.orm.scoping import scoped_session
+from model_snapshot import ModelSnapshot
 from repositories.item_features_repository import ItemFeaturesRepository
 from repositories.lightfm_repository import LightfmRepository
 from scipy.sparse import csr_matrix
@@ -7,39 +8,183 @@ from repositories.user_features_repository import UserFeaturesRepository
 
 
 class LightfmService:
+
+    # weight of liked books relative to the other books when folding in a user, alpha from implicit ALS
+    FOLD_IN_CONFIDENCE: float = 40.0
+    # L2 regularization of the folded in embedding and bias
+    FOLD_IN_REGULARIZATION: float = 1.0
+
     def __init__(self, scoped_session: scoped_session):
         self.lightfm_repository = LightfmRepository()
         self.item_features_repository = ItemFeaturesRepository()
         self.user_features_repository = UserFeaturesRepository()
 
-    def get_item_representations(self) -> np.ndarray:
-        """Returns the concatenation between bias and embedding for each item from `model`."""
-        item_features = self.item_features_repository.get_item_features()
-        return self.get_item_representations_by_features(item_features)
+    def get_item_representations(self, snapshot: ModelSnapshot | None = None) -> np.ndarray:
+        """
+        Returns the concatenation between bias and embedding for each item from the model of `snapshot`, the current snapshot if None.
+        The result is built once per snapshot and stored in it, therefore it is read only.
+        """
+        snapshot = self.__get_snapshot(snapshot)
+        item_representations = snapshot.get_item_representations()
+        if item_representations is None:
+            item_features = self.item_features_repository.get_item_features()
+            item_representations = snapshot.set_item_representations_if_missing(
+                self.get_item_representations_by_features(item_features, snapshot))
+        return item_representations
 
-    def get_item_representations_by_features(self, item_features: csr_matrix) -> np.ndarray:
-        """Returns the concatenation between bias and embedding for each item in `item_features` from `model`."""
-        model = self.lightfm_repository.get_model()
+    def get_item_representations_by_features(self, item_features: csr_matrix, snapshot: ModelSnapshot | None = None) -> np.ndarray:
+        """Returns the concatenation between bias and embedding for each item in `item_features` from the model of `snapshot`."""
+        model = self.__get_snapshot(snapshot).model
         bias, components = model.get_item_representations(item_features)
         return self.__concatenate_bias_components(bias, components)
 
-    def find_single_item_representation(self, id: int) -> np.ndarray:
+    def find_single_item_representation(self, id: int, snapshot: ModelSnapshot | None = None) -> np.ndarray:
         """
         Finds item_representation by book `id`. 
 
         Args:
             id (int). Id of the book to get its representation.
+            snapshot (ModelSnapshot | None): Snapshot to read from, the current snapshot if None.
 
         Returns:
-            np.ndarray (single dimensional array) | None.
+            np.ndarray (single dimensional read only view) | None.
         """
         if id < 0 or id >= self.item_features_repository.get_nr_items():
             return None
-        features = self.item_features_repository.get_item_features()
-        model = self.lightfm_repository.get_model()
-        bias, components = model.get_item_representations(features[id])
+        return self.get_item_representations(snapshot)[id]
+
+    def find_item_representations(self, ids: list[int], snapshot: ModelSnapshot | None = None) -> np.ndarray | None:
+        """
+        Finds item_representations by book `ids`.
+
+        Args:
+            ids (list[int]). Ids of the books to get their representations.
+            snapshot (ModelSnapshot | None): Snapshot to read from, the current snapshot if None.
+
+        Returns:
+            np.ndarray (two dimensional array, row i belongs to ids[i]) | None: None if any id doesn't exist.
+        """
+        nr_items = self.item_features_repository.get_nr_items()
+        if any(id < 0 or id >= nr_items for id in ids):
+            return None
+        return self.get_item_representations(snapshot)[ids]
+
+    def get_user_representation(self, user_feature: csr_matrix, snapshot: ModelSnapshot | None = None) -> np.ndarray:
+        """
+        Returns the concatenation between bias and embedding of a single user from the model of `snapshot`.
+
+        Args:
+            user_feature (csr_matrix): Single row containing all features of the user.
+            snapshot (ModelSnapshot | None): Snapshot to read from, the current snapshot if None.
+
+        Returns:
+            np.ndarray (single dimensional array).
+        """
+        snapshot = self.__get_snapshot(snapshot)
+        user_feature = self.slice_user_features_to_snapshot(user_feature, snapshot)
+        bias, components = snapshot.model.get_user_representations(user_feature)
         return self.__concatenate_bias_components(bias, components)[0]
 
+    def slice_user_features_to_snapshot(self, user_features: csr_matrix, snapshot: ModelSnapshot | None = None) -> csr_matrix:
+        """
+        Removes columns of `user_features` that have no embedding in the model of `snapshot`. Features of users added
+        after the snapshot was published belong to those users only, therefore they are 0 for users of the snapshot.
+
+        Args:
+            user_features (csr_matrix): One row for each user.
+            snapshot (ModelSnapshot | None): Snapshot to read from, the current snapshot if None.
+
+        Returns:
+            csr_matrix.
+        """
+        nr_user_embeddings = self.__get_snapshot(snapshot).model.user_embeddings.shape[0]
+        if user_features.shape[1] <= nr_user_embeddings:
+            return user_features
+        return user_features[:, :nr_user_embeddings]
+
+    def predict_scores_by_user_representation(self, user_representation: np.ndarray,
+                                              snapshot: ModelSnapshot | None = None, ids: np.ndarray | None = None) -> np.ndarray:
+        """
+        Scores all items for a single user, same as `model.predict` but as a single matrix vector product against cached item representations.
+
+        Args:
+            user_representation (np.ndarray): Single dimensional array, bias followed by embedding.
+            snapshot (ModelSnapshot | None): Snapshot to read from, the current snapshot if None.
+            ids (np.ndarray | None): Items to score, all items if None.
+
+        Returns:
+            np.ndarray: Single dimensional array with a score for each item, or for each item in `ids`.
+        """
+        item_representations = self.get_item_representations(snapshot)
+        if ids is not None:
+            item_representations = item_representations[ids]
+        # item representations are [item_bias, item_embedding], therefore multiplying by [1, user_embedding]
+        # gives item_bias + item_embedding . user_embedding
+        weights = np.concatenate(
+            [[1], user_representation[1:]]).astype(item_representations.dtype)
+        return item_representations @ weights + user_representation[0]
+
+    def get_item_gram(self, snapshot: ModelSnapshot | None = None) -> np.ndarray:
+        """
+        Returns A^T A where A is item representations of `snapshot` with the bias column replaced by ones.
+        The result is built once per snapshot items and stored in the snapshot, therefore it is read only.
+        """
+        snapshot = self.__get_snapshot(snapshot)
+        item_gram = snapshot.get_item_gram()
+        if item_gram is None:
+            item_representations = self.get_item_representations(
+                snapshot).astype(np.float64)
+            item_representations[:, 0] = 1
+            item_gram = snapshot.set_item_gram_if_missing(
+                item_representations.T @ item_representations)
+        return item_gram
+
+    def fold_in_user(self, user_id: int, user_feature: csr_matrix, liked_book_ids: list[int]) -> ModelSnapshot:
+        """
+        Computes embedding and bias of the unique feature of user in closed form, without training. Items and the other
+        user features are fixed, the unique feature is solved with weighted regularized least squares so that the predicted
+        score is 1 for liked books and 0 for the others, liked books having FOLD_IN_CONFIDENCE more weight (implicit ALS).
+        Costs a single pass over item representations and a linear system of size `no_components + 1`.
+
+        Args:
+            user_id (int): User id, user must be added.
+            user_feature (csr_matrix): Single row containing all features of the user.
+            liked_book_ids (list[int]): Ids of books liked by user.
+
+        Returns:
+            ModelSnapshot: Next snapshot with the folded in user, it isn't published.
+        """
+        snapshot = self.lightfm_repository.get_snapshot()
+        model = snapshot.model
+        unique_feature_index = self.find_user_row(user_id)
+        user_feature = csr_matrix(user_feature)
+        is_common = user_feature.indices != unique_feature_index
+        common_indices = user_feature.indices[is_common]
+        common_weights = user_feature.data[is_common].astype(np.float64)
+        unique_weight = float(user_feature[0, unique_feature_index])
+
+        # user representation is [common_bias, common_embedding] + unique_weight * x, x = [bias, embedding] of unique feature
+        common = np.concatenate([[common_weights @ model.user_biases[common_indices]],
+                                 common_weights @ model.user_embeddings[common_indices]])
+        item_representations = self.get_item_representations(snapshot)
+        # score of item i is offsets[i] + unique_weight * a_i . x, a_i is item representation with bias replaced by 1
+        offsets = item_representations[:, 0] + item_representations[:, 1:] @ common[1:] + common[0]
+        liked = item_representations[liked_book_ids].astype(np.float64)
+        liked[:, 0] = 1
+        liked_offsets = offsets[liked_book_ids].astype(np.float64)
+
+        # sum of (1 + c * liked_i) * (liked_i - offsets_i - unique_weight * a_i . x) ^ 2 + regularization * ||x|| ^ 2
+        # over all items is minimized by the solution of lhs x = rhs
+        confidence = LightfmService.FOLD_IN_CONFIDENCE
+        lhs = unique_weight ** 2 * (self.get_item_gram(snapshot) + confidence * liked.T @ liked) + \
+            LightfmService.FOLD_IN_REGULARIZATION * np.eye(liked.shape[1])
+        all_items_times_offsets = np.concatenate(
+            [[offsets.sum(dtype=np.float64)], item_representations[:, 1:].T @ offsets])
+        rhs = unique_weight * ((1 + confidence) * liked.sum(axis=0) - all_items_times_offsets
+                               - confidence * liked.T @ liked_offsets)
+        x = np.linalg.solve(lhs, rhs)
+        return self.lightfm_repository.new_snapshot_with_user_embedding(unique_feature_index, x[1:], x[0])
+
     def is_user_added(self, user_id: int) -> bool:
         """
         Check user embeddings and user features to see if `user_id` is added.
@@ -50,8 +195,43 @@ class LightfmService:
         Returns:
             bool.
         """
-        return (self.user_features_repository.get_nr_user_features_to_add(user_id) <= 0) and\
-            (self.__get_nr_user_embeddings_to_add(user_id) <= 0)
+        row = self.find_user_row(user_id)
+        return row is not None and row < self.lightfm_repository.get_model().user_embeddings.shape[0]
+
+    def find_user_row(self, user_id: int) -> int | None:
+        """
+        Finds the row of user arrays of the unique feature of `user_id`, it is also its column of user features.
+
+        Args:
+            user_id (int): User id.
+
+        Returns:
+            int | None: None if user has no user features.
+        """
+        unique_feature = self.user_features_repository.find_unique_feature(user_id)
+        if unique_feature is None:
+            return None
+        return self.user_features_repository.get_nr_common_features() + unique_feature
+
+    def check_user_rows_match_features(self) -> None:
+        """
+        Checks that the model has no user rows without a user feature. User features are logged when a user is added,
+        before the model is saved, therefore the model may have fewer user rows than user features, those rows are added by
+        add_user_embeddings_if_feature_mismatch, but more user rows mean the log of added users is older than the model
+        and rows would be given to other users.
+
+        Raises:
+            ValueError: If the model has more user rows than user features.
+        """
+        nr_features = self.user_features_repository.get_nr_features()
+        nr_embeddings = self.lightfm_repository.get_model().user_embeddings.shape[0]
+        if nr_embeddings > nr_features:
+            raise ValueError(f"Model has {nr_embeddings} user rows but user features have {nr_features} columns, "
+                             f"log of added users doesn't match the model")
+
+    def has_user_embedding_feature_mismatch(self) -> bool:
+        """Checks if there are more user features than user embeddings, see add_user_embeddings_if_feature_mismatch."""
+        return self.__get_user_embedding_feature_size_mismatch() > 0
 
     def add_user_embeddings_if_feature_mismatch(self) -> None:
         """
@@ -65,36 +245,40 @@ class LightfmService:
 
     def add_new_users(self, user_id: int) -> None:
         """
-        Checks if user_id is added, if not add new user features and user embeddings, gradients, momentum.
+        Checks if user_id is added, if not add a user feature and user embeddings, gradients, momentum for it.
+        Rows are only added for `user_id`, not for users with lower ids that didn't train.
 
         Args:
-            user_id (int): Computes distance between current_features/embeddings and user id to 
-            check how many embeddings/features to add.
+            user_id (int): User id.
 
         Returns:
             None.
 
         """
         # warning, in some cases user features will be added while embeddings won't be added
-        nr_user_features_to_add = self.user_features_repository.get_nr_user_features_to_add(
-            user_id)
-        if nr_user_features_to_add > 0:
-            self.user_features_repository.add_new_user_features(
-                nr_user_features_to_add)
-
-        nr_user_embeddings_to_add = self.__get_nr_user_embeddings_to_add(
-            user_id)
+        self.user_features_repository.add_user(user_id)
+
+        # embeddings of users added before may be missing too, see add_user_embeddings_if_feature_mismatch
+        nr_user_embeddings_to_add = self.find_user_row(user_id) + 1 - \
+            self.lightfm_repository.get_model().user_embeddings.shape[0]
         if nr_user_embeddings_to_add > 0:
             self.lightfm_repository.add_new_user_embeddings(
                 nr_user_embeddings_to_add)
 
     def reset_user_gradients(self, user_id: int) -> None:
         """Resets bias and embedding gradients to 0 for `user_id`."""
-        nr_common_features = self.user_features_repository.get_nr_common_features()
+        row = self.find_user_row(user_id)
         model = self.lightfm_repository.get_model()
-        model.user_embedding_gradients[nr_common_features +
-                                       user_id] = np.ones(model.no_components)
-        model.user_bias_gradients[nr_common_features + user_id] = 1
+        model.user_embedding_gradients[row] = np.ones(model.no_components)
+        model.user_bias_gradients[row] = 1
+        self.lightfm_repository.mark_changed_rows(
+            'user_embedding_gradients', [row])
+        self.lightfm_repository.mark_changed_rows(
+            'user_bias_gradients', [row])
+
+    def __get_snapshot(self, snapshot: ModelSnapshot | None) -> ModelSnapshot:
+        """Returns `snapshot` or the current snapshot if None."""
+        return self.lightfm_repository.get_snapshot() if snapshot is None else snapshot
 
     def __concatenate_bias_components(self, bias: np.ndarray, components: np.ndarray) -> np.ndarray:
         """
@@ -109,28 +293,6 @@ class LightfmService:
         """
         return np.concatenate([bias.reshape(-1, 1), components], axis=1)
 
-    def __get_nr_user_embeddings_to_add(self, user_id: int) -> None:
-        """
-        Gets number of user embeddings to add for each new user by computing the distance between `user_id` and (unique embeddings - 1) from model.
-
-        Args:
-            user_id (int): User id.
-
-        Returns:
-            None.
-        """
-        # user_embeddings also has common embeddings, therefore remove them
-        unique_embeddings_len = self.__get_number_of_unique_embeddings()
-        # user id starts count from 0 while unique_embeddings_len starts from 1, therefore subtract 1 from embeddings
-        nr_embeddings_to_add = user_id - (unique_embeddings_len - 1)
-        return nr_embeddings_to_add
-
-    def __get_number_of_unique_embeddings(self) -> int:
-        """Get number of embeddings that are associated with unique features."""
-        model = self.lightfm_repository.get_model()
-        return model.user_embeddings.shape[0] - \
-            self.user_features_repository.get_nr_common_features()
-
     def __get_user_embedding_feature_size_mismatch(self) -> int:
         """
         Gets how many more features there are than embeddings.
@@ -4,6 +4,8 @@ from dtos.liked_categories.post_liked_category_dto import PostLikedCategoryDto
 from repositories.book_repository import BookRepository
 from repositories.category_repository import CategoryRepository
 from repositories.liked_category_repository import LikedCategoryRepository
+from repositories.training_status_cache_repository import TrainingStatusCacheRepository
+from repositories.user_data_version_repository import UserDataVersionRepository
 
 
 class LikedCategoryError(Exception):
@@ -24,6 +26,8 @@ class LikedCategoryService:
         self.liked_category_repository = LikedCategoryRepository(
             scoped_session)
         self.category_repository = CategoryRepository(scoped_session)
+        self.user_data_version_repository = UserDataVersionRepository()
+        self.training_status_cache_repository = TrainingStatusCacheRepository()
 
     def rate(self, dto: PostLikedCategoryDto) -> None:
         """
@@ -53,3 +57,7 @@ class LikedCategoryService:
                 self.liked_category_repository.create(model)
         elif model is not None:
             self.liked_category_repository.delete(model)
+        # invalidates cached data computed from user liked categories
+        self.user_data_version_repository.increment_liked_category_version(
+            dto.user_id)
+        self.training_status_cache_repository.invalidate(dto.user_id)
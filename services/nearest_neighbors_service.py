@@ -1,23 +1,41 @@
+from threading import Lock, Thread
 import numpy as np
 from sqlalchemy.orm.scoping import scoped_session
+from model_snapshot import ModelSnapshot
+from repositories.item_neighbors_repository import ItemNeighborsRepository
+from repositories.lightfm_repository import LightfmRepository
 from repositories.nearest_neighbors_repository import NearestNeighborsRepository
 from services.item_preprocessing_service import ItemPreprocessingService
 from services.lightfm_service import LightfmService
+from thread_budget import thread_budget
+from vector_index import ExactCosineIndex, IvfCosineIndex, compute_neighbor_table, update_neighbor_table
 
 
 class NearestNeighborsService:
+
+    # a single table job runs at a time, it shares background threads with training
+    thread_budget.reserve_background_jobs(1)
+
+    __table_job_lock = Lock()
+    __is_table_job_running = False
+    # (item_representations, item_version) requested while a job was running
+    __pending_table_job: tuple[np.ndarray, int] | None = None
+
     def __init__(self, scoped_session: scoped_session):
         self.nearest_neighbors_repository = NearestNeighborsRepository()
+        self.item_neighbors_repository = ItemNeighborsRepository()
+        self.lightfm_repository = LightfmRepository()
         self.lightfm_service = LightfmService(scoped_session)
         self.item_preprocessing_service = ItemPreprocessingService(
             scoped_session)
 
-    def find_nearest_neighbors_by_id(self, id: int) -> np.ndarray | None:
+    def find_nearest_neighbors_by_id(self, id: int, snapshot: ModelSnapshot | None = None) -> np.ndarray | None:
         """
         Finds nearest neighbors indices of book by `id`.
 
         Args:
             id (int). Id of the book to get its nearest neighbors indices.
+            snapshot (ModelSnapshot | None): Snapshot to read from, the current snapshot if None.
 
         Returns:
             np.ndarray (one dimensional array): A one dimensional array containing the indices of the nearest neighbors of book.
@@ -25,15 +43,47 @@ class NearestNeighborsService:
             None: If id doesn't exist.
 
         """
+        snapshot = self.__get_snapshot(snapshot)
+        # precomputed table is only used if it was computed for the same items
+        indices = self.item_neighbors_repository.find_neighbors(
+            id, snapshot.item_version)
+        if indices is not None:
+            return indices
         item_representation = self.lightfm_service.find_single_item_representation(
-            id)
+            id, snapshot)
         if item_representation is None:
             return None
         indices = self.nearest_neighbors_repository.get_nearest_neighbors_for_single_item(
-            item_representation)
+            self.get_index(snapshot), item_representation)
         return indices
 
-    def get_nearest_neighbors_by_content(self, content: str, categories: list, authors: list) -> np.ndarray:
+    def find_nearest_neighbors_by_ids(self, ids: list[int], snapshot: ModelSnapshot | None = None) -> np.ndarray | None:
+        """
+        Finds nearest neighbors indices of many books by `ids` in a single search.
+
+        Args:
+            ids (list[int]). Ids of the books to get their nearest neighbors indices.
+            snapshot (ModelSnapshot | None): Snapshot to read from, the current snapshot if None.
+
+        Returns:
+            np.ndarray (two dimensional array): Row i contains the indices of the nearest neighbors of book `ids[i]`.
+            or
+            None: If any id doesn't exist.
+        """
+        snapshot = self.__get_snapshot(snapshot)
+        indices = self.item_neighbors_repository.find_neighbors_of_many(
+            ids, snapshot.item_version)
+        if indices is not None:
+            return indices
+        item_representations = self.lightfm_service.find_item_representations(
+            ids, snapshot)
+        if item_representations is None:
+            return None
+        return self.nearest_neighbors_repository.get_nearest_neighbors_for_items(
+            self.get_index(snapshot), item_representations)
+
+    def get_nearest_neighbors_by_content(self, content: str, categories: list, authors: list,
+                                         snapshot: ModelSnapshot | None = None) -> np.ndarray:
         """
         Gets nearest neighbors indices using `content`, `categories`, and `authors`.
 
@@ -41,17 +91,156 @@ class NearestNeighborsService:
             content (str): Book description.
             categories (list): Book categories.
             authors (list): Book authors.
+            snapshot (ModelSnapshot | None): Snapshot to read from, the current snapshot if None.
 
         Returns:
             np.ndarray (one dimensional array): A one dimensional array containing the indices of the nearest neighbors using content.
 
         """
+        snapshot = self.__get_snapshot(snapshot)
         item_representation = self.item_preprocessing_service.get_item_representation_by_content(
-            content, categories, authors)
+            content, categories, authors, snapshot)
         indices = self.nearest_neighbors_repository.get_nearest_neighbors_for_single_item(
-            item_representation)
+            self.get_index(snapshot), item_representation)
         return indices
     
+    def get_nearest_neighbors_by_contents(self, contents: list[str], categories: list[list], authors: list[list],
+                                          snapshot: ModelSnapshot | None = None) -> np.ndarray:
+        """
+        Gets nearest neighbors indices of many contents in a single search, row i is built from `contents[i]`, `categories[i]` and `authors[i]`.
+
+        Args:
+            contents (list[str]): Book descriptions.
+            categories (list[list]): Categories of each book.
+            authors (list[list]): Authors of each book.
+            snapshot (ModelSnapshot | None): Snapshot to read from, the current snapshot if None.
+
+        Returns:
+            np.ndarray (two dimensional array): Row i contains the indices of the nearest neighbors of content i.
+        """
+        snapshot = self.__get_snapshot(snapshot)
+        item_representations = self.item_preprocessing_service.get_item_representations_by_contents(
+            contents, categories, authors, snapshot)
+        return self.nearest_neighbors_repository.get_nearest_neighbors_for_items(
+            self.get_index(snapshot), item_representations)
+
+    def get_index(self, snapshot: ModelSnapshot | None = None) -> ExactCosineIndex | IvfCosineIndex:
+        """Gets the index of `snapshot`, the current snapshot if None, building it if it is missing."""
+        snapshot = self.__get_snapshot(snapshot)
+        index = snapshot.get_index()
+        if index is None:
+            item_representations = self.lightfm_service.get_item_representations(
+                snapshot)
+            index = snapshot.set_index_if_missing(
+                self.nearest_neighbors_repository.build_index(item_representations))
+        return index
+
     def refit_neighbors(self):
-        item_representations = self.lightfm_service.get_item_representations()
-        self.nearest_neighbors_repository.get_model().fit(item_representations)
\ No newline at end of file
+        """Builds the index of the current snapshot if it is missing."""
+        self.get_index()
+
+    def set_updated_index(self, snapshot: ModelSnapshot, base_snapshot: ModelSnapshot,
+                          drift_threshold: float | None = None, max_updated_fraction: float | None = None) -> None:
+        """
+        Sets the index of `snapshot`, which isn't published yet, from the index of `base_snapshot` by updating a copy
+        of it with only the books whose representation changed. Builds a new index if too many changed or
+        `base_snapshot` has no index. The index of `base_snapshot` isn't modified. Does nothing if `snapshot` has an index.
+
+        Args:
+            snapshot (ModelSnapshot): Snapshot to set the index of.
+            base_snapshot (ModelSnapshot): Snapshot `snapshot` was created from.
+            drift_threshold (float | None): Cosine distance above which a book is updated,
+            NearestNeighborsRepository.DRIFT_THRESHOLD if None.
+            max_updated_fraction (float | None): Fraction of books above which the index is rebuilt,
+            NearestNeighborsRepository.MAX_UPDATED_FRACTION if None.
+
+        Returns:
+            None.
+        """
+        if drift_threshold is None:
+            drift_threshold = NearestNeighborsRepository.DRIFT_THRESHOLD
+        if max_updated_fraction is None:
+            max_updated_fraction = NearestNeighborsRepository.MAX_UPDATED_FRACTION
+
+        if snapshot.get_index() is not None:
+            return
+        base_index = base_snapshot.get_index()
+        if base_index is None:
+            self.get_index(snapshot)
+            return
+        item_representations = self.lightfm_service.get_item_representations(
+            snapshot)
+        ids = self.nearest_neighbors_repository.find_drifted_rows(
+            base_index, item_representations, drift_threshold)
+        if len(ids) > max_updated_fraction * item_representations.shape[0]:
+            index = self.nearest_neighbors_repository.build_index(
+                item_representations)
+        elif len(ids) > 0:
+            index = self.nearest_neighbors_repository.build_updated_index(
+                base_index, ids, item_representations[ids])
+        else:
+            # indexes are never modified, therefore snapshots can share one
+            index = base_index
+        snapshot.set_index_if_missing(index)
+
+    def rebuild_neighbor_table_in_background(self, snapshot: ModelSnapshot | None = None) -> None:
+        """
+        Starts a thread that computes the nearest neighbors of every book for `snapshot`, the current snapshot if None,
+        and publishes them as the precomputed table. If a job is already running, the table is computed again after it finishes.
+        Only books that drifted since the published table, or the table saved by the previous process, are computed again,
+        see update_neighbor_table.
+
+        Args:
+            snapshot (ModelSnapshot | None): Snapshot to compute the table for.
+
+        Returns:
+            None.
+        """
+        snapshot = self.__get_snapshot(snapshot)
+        job = (self.lightfm_service.get_item_representations(snapshot),
+               snapshot.item_version)
+        with NearestNeighborsService.__table_job_lock:
+            if NearestNeighborsService.__is_table_job_running:
+                NearestNeighborsService.__pending_table_job = job
+                return
+            NearestNeighborsService.__is_table_job_running = True
+        Thread(target=self.__run_neighbor_table_jobs, args=job, daemon=True).start()
+
+    def __get_snapshot(self, snapshot: ModelSnapshot | None) -> ModelSnapshot:
+        """Returns `snapshot` or the current snapshot if None."""
+        return self.lightfm_repository.get_snapshot() if snapshot is None else snapshot
+
+    def __run_neighbor_table_jobs(self, item_representations: np.ndarray, version: int) -> None:
+        """Computes and publishes tables until there is no pending job."""
+        while True:
+            try:
+                vectors = self.__write_neighbor_table(item_representations)
+                self.item_neighbors_repository.publish(version, vectors)
+            except Exception:
+                # searches keep using the index, next model change starts a new job
+                with NearestNeighborsService.__table_job_lock:
+                    NearestNeighborsService.__is_table_job_running = False
+                    NearestNeighborsService.__pending_table_job = None
+                raise
+            with NearestNeighborsService.__table_job_lock:
+                if NearestNeighborsService.__pending_table_job is None:
+                    NearestNeighborsService.__is_table_job_running = False
+                    return
+                item_representations, version = NearestNeighborsService.__pending_table_job
+                NearestNeighborsService.__pending_table_job = None
+
+    def __write_neighbor_table(self, item_representations: np.ndarray) -> np.ndarray:
+        """Writes the table of `item_representations` to the temporary path, returns the vectors it was computed for."""
+        # the published table, or the table of the previous process, is updated instead of computed again
+        published = self.item_neighbors_repository.find_table()
+        if published is None:
+            return compute_neighbor_table(item_representations,
+                                          NearestNeighborsRepository.N_NEIGHBORS,
+                                          self.item_neighbors_repository.get_temporary_path(),
+                                          thread_budget.get_job_threads())
+        previous_table, previous_vectors = published
+        return update_neighbor_table(item_representations, previous_vectors, previous_table,
+                                     self.item_neighbors_repository.get_temporary_path(),
+                                     thread_budget.get_job_threads(),
+                                     NearestNeighborsRepository.DRIFT_THRESHOLD,
+                                     NearestNeighborsRepository.MAX_UPDATED_FRACTION)
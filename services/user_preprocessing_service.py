@@ -30,10 +30,8 @@ class UserPreprocessingService:
             raise ValueError(f"User with id {id} doesn't exist")
         
         categories = self.__get_transformed_categories_by_user_id(id)
-        user_feature = self.user_features_repository.get_user_features()[id]
-        nr_common_features = self.user_features_repository.get_nr_common_features()
-        user_feature_unique = user_feature[0, nr_common_features:]
-        return hstack([categories, user_feature_unique ])
+        user_feature_unique = self.user_features_repository.get_unique_user_feature(id)
+        return hstack([categories, user_feature_unique])
 
     def __get_transformed_categories_by_user_id(self, id: int) -> csr_matrix:
         """
@@ -1,8 +1,8 @@
 from sqlalchemy.orm.scoping import scoped_session
 from db_models.book_rating import BookRating
 from dtos.users.get_rating_dto import GetRatingDto
-from repositories.book_image_repository import BookImageRepository
 from repositories.user_repository import UserRepository
+from services.book_service import BookService
 from dtos.users.get_user_with_book_rating_dto import GetUserWithBookRatingDto
 from db_models.user import User
 
@@ -34,11 +34,13 @@ class UserService:
 
     @staticmethod
     def map_rating_to_dto(model: BookRating) -> GetRatingDto:
-        image = BookImageRepository.convert_image_base64(model.book.image_link)
+        image = BookService.get_image(model.book.image_link)
+        image_url = BookService.get_image_url(model.book_id, model.book.image_link)
         dto = GetRatingDto(model.book_id,
                            model.book.title,
                            model.rating,
                            image,
+                           image_url,
                            model.book.link,
                            model.book.nr_likes,
                            model.book.nr_dislikes)
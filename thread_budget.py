@@ -0,0 +1,74 @@
+import os
+from threading import Lock
+from threadpoolctl import ThreadpoolController
+
+
+class ThreadBudget:
+    """
+    Splits the cores available to the process between serving requests and background work, training and neighbor tables.
+    Serving gets `serving_share` of the cores, at least one, background work gets the rest, at least one.
+
+    threadpoolctl limits apply to the whole process, not to the calling thread, therefore BLAS gets a single limit, the number of
+    serving threads, set once by `apply_blas_limit`. LightFM takes its number of OpenMP threads as an argument, therefore each
+    background job gets its own part of the background threads from `get_job_threads`. Every component running background
+    jobs reserves the maximum number of its jobs running at the same time with `reserve_background_jobs`, the background
+    threads are split between all reserved jobs, therefore jobs of different components never claim more than the budget.
+    """
+
+    def __init__(self, serving_share: float = 0.25, nr_cores: int | None = None):
+        """
+        Args:
+            serving_share (float): From 0 to 1, fraction of the cores reserved for serving.
+            nr_cores (int | None): Number of cores to split, cores the process may run on if None.
+        """
+        self.nr_cores = ThreadBudget.get_available_cores() if nr_cores is None else max(1, nr_cores)
+        self.serving_threads = min(self.nr_cores, max(1, round(self.nr_cores * serving_share)))
+        self.background_threads = max(1, self.nr_cores - self.serving_threads)
+        self.__nr_background_jobs = 0
+        self.__controller: ThreadpoolController | None = None
+        self.__blas_limiter = None
+        self.__lock = Lock()
+
+    @staticmethod
+    def get_available_cores() -> int:
+        """Gets number of cores the process may run on, less than os.cpu_count() if affinity is restricted, for example in a container."""
+        if hasattr(os, 'sched_getaffinity'):
+            return max(1, len(os.sched_getaffinity(0)))
+        return os.cpu_count() or 1
+
+    def reserve_background_jobs(self, nr_jobs: int) -> None:
+        """
+        Reserves a share of the background threads for `nr_jobs` more jobs that may run at the same time as the others.
+        Must be called before the reserved jobs start, shares of jobs that already got their threads aren't reduced.
+
+        Args:
+            nr_jobs (int): Maximum number of jobs of the component running at the same time.
+
+        Returns:
+            None.
+        """
+        with self.__lock:
+            self.__nr_background_jobs += nr_jobs
+
+    def get_job_threads(self) -> int:
+        """
+        Gets number of threads of a background job, background threads are split equally between all reserved jobs.
+
+        Returns:
+            int: At least 1.
+        """
+        return max(1, self.background_threads // max(1, self.__nr_background_jobs))
+
+    def apply_blas_limit(self) -> None:
+        """Limits BLAS thread pools of the process to the serving threads, does nothing after the first call."""
+        with self.__lock:
+            if self.__blas_limiter is not None:
+                return
+            self.__controller = ThreadpoolController()
+            # the limiter restores the previous limits only when asked to, keeping it keeps the limit for the process lifetime
+            self.__blas_limiter = self.__controller.limit(
+                limits=self.serving_threads, user_api='blas')
+
+
+# shared by every component of the process, a budget per component would give away the same cores more than once
+thread_budget = ThreadBudget()
@@ -0,0 +1,102 @@
+from enum import Enum
+import time
+
+
+class BudgetStopReason(Enum):
+    MAX_SECONDS = 0
+    MAX_EPOCHS = 1
+    PLATEAU = 2
+
+
+class TrainingBudget:
+    """
+    Decides how many epochs to train before the next progress check. Training stops when `max_seconds` or `max_epochs`
+    are used or when progress improved less than `min_improvement` for `patience` checks in a row.
+
+    Progress goes from 0 to 1. The next number of epochs is the estimate of epochs needed to reach 1 at the rate of the
+    last check, bounded by `min_chunk_epochs` and `max_chunk_epochs`, therefore checks are frequent close to the target
+    and rare when progress is slow. If progress didn't improve, the number of epochs doubles.
+    """
+
+    def __init__(self, max_seconds: float = 300, max_epochs: int = 2000, initial_chunk_epochs: int = 100,
+                 min_chunk_epochs: int = 10, max_chunk_epochs: int = 400, patience: int = 3, min_improvement: float = 0.005):
+        self.max_seconds = max_seconds
+        self.max_epochs = max_epochs
+        self.min_chunk_epochs = min_chunk_epochs
+        self.max_chunk_epochs = max_chunk_epochs
+        self.patience = patience
+        self.min_improvement = min_improvement
+        self.__chunk_epochs = initial_chunk_epochs
+        self.__start_time = time.monotonic()
+        self.__chunk_start_time = self.__start_time
+        self.__used_epochs = 0
+        self.__seconds_per_epoch: float | None = None
+        self.__last_progress: float | None = None
+        self.__nr_checks_without_improvement = 0
+        self.__stop_reason: BudgetStopReason | None = None
+
+    def get_used_epochs(self) -> int:
+        """Gets number of epochs recorded so far."""
+        return self.__used_epochs
+
+    def get_stop_reason(self) -> BudgetStopReason | None:
+        """Gets why `next_epochs` returned 0, None if it didn't."""
+        return self.__stop_reason
+
+    def next_epochs(self) -> int:
+        """
+        Gets number of epochs to train before the next call to `record`.
+
+        Returns:
+            int: 0 if the budget is exhausted or progress reached a plateau, see `get_stop_reason`.
+        """
+        if self.__stop_reason is not None:
+            return 0
+        if self.__nr_checks_without_improvement >= self.patience:
+            self.__stop_reason = BudgetStopReason.PLATEAU
+            return 0
+        remaining_epochs = self.max_epochs - self.__used_epochs
+        if remaining_epochs <= 0:
+            self.__stop_reason = BudgetStopReason.MAX_EPOCHS
+            return 0
+        epochs = min(self.__chunk_epochs, remaining_epochs)
+        if self.__seconds_per_epoch is not None:
+            remaining_seconds = self.max_seconds - \
+                (time.monotonic() - self.__start_time)
+            epochs = min(epochs, int(remaining_seconds / self.__seconds_per_epoch))
+        if epochs <= 0:
+            self.__stop_reason = BudgetStopReason.MAX_SECONDS
+            return 0
+        self.__chunk_start_time = time.monotonic()
+        return epochs
+
+    def record(self, epochs: int, progress: float) -> None:
+        """
+        Records that `epochs` were trained, returned by the last `next_epochs`, and the progress measured after them.
+
+        Args:
+            epochs (int): Number of trained epochs.
+            progress (float): From 0 to 1, 1 is the target.
+
+        Returns:
+            None.
+        """
+        # time of progress checks is included, they are part of training
+        self.__seconds_per_epoch = (time.monotonic() - self.__chunk_start_time) / epochs
+        self.__used_epochs += epochs
+        if self.__last_progress is None:
+            self.__last_progress = progress
+            return
+        improvement = progress - self.__last_progress
+        self.__last_progress = progress
+        if improvement < self.min_improvement:
+            self.__nr_checks_without_improvement += 1
+        else:
+            self.__nr_checks_without_improvement = 0
+        if improvement > 0:
+            needed_epochs = (1 - progress) / (improvement / epochs)
+            self.__chunk_epochs = int(
+                min(max(needed_epochs, self.min_chunk_epochs), self.max_chunk_epochs))
+        else:
+            self.__chunk_epochs = min(
+                self.__chunk_epochs * 2, self.max_chunk_epochs)
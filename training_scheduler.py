@@ -0,0 +1,117 @@
+from collections import OrderedDict
+import logging
+from threading import Condition, Thread
+from typing import Any, Callable, Hashable
+from thread_budget import ThreadBudget
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingScheduler:
+    """
+    FIFO queue of jobs identified by a key, at most `max_concurrent_jobs` batches run at the same time on worker threads.
+    A worker takes up to `max_batch_size` jobs from the front of the queue and runs them together with `run_jobs`.
+    A key can only be queued or running once.
+    """
+
+    def __init__(self, run_jobs: Callable[[list[Any]], None], max_concurrent_jobs: int, max_queued_jobs: int,
+                 max_batch_size: int = 1, on_queue_changed: Callable[[], None] | None = None):
+        """
+        Args:
+            run_jobs (Callable[[list[Any]], None]): Runs a batch of jobs, in submit order.
+            max_concurrent_jobs (int): Number of batches running at the same time, bounded by the number of cores.
+            max_queued_jobs (int): Number of jobs waiting to run above which `submit` refuses jobs.
+            max_batch_size (int): Maximum number of jobs in a batch.
+            on_queue_changed (Callable[[], None] | None): Called after queue positions changed, without holding the scheduler lock.
+        """
+        self.max_concurrent_jobs = max(
+            1, min(max_concurrent_jobs, ThreadBudget.get_available_cores()))
+        self.max_queued_jobs = max_queued_jobs
+        self.max_batch_size = max(1, max_batch_size)
+        self.__run_jobs = run_jobs
+        self.__on_queue_changed = on_queue_changed
+        # key -> job, in submit order
+        self.__queue: OrderedDict[Hashable, Any] = OrderedDict()
+        self.__running: set[Hashable] = set()
+        self.__condition = Condition()
+        self.__workers: list[Thread] = []
+
+    def submit(self, key: Hashable, job: Any) -> bool:
+        """
+        Appends `job` to the queue.
+
+        Args:
+            key (Hashable): Identifies the job, for example a user id.
+            job (Any): Passed to `run_jobs` on a worker thread.
+
+        Returns:
+            bool: False if `key` is already queued or running or the queue is full.
+        """
+        with self.__condition:
+            if key in self.__queue or key in self.__running or self.is_full():
+                return False
+            self.__queue[key] = job
+            self.__start_workers()
+            self.__condition.notify()
+        return True
+
+    def is_scheduled(self, key: Hashable) -> bool:
+        """Returns True if job with `key` is queued or running."""
+        with self.__condition:
+            return key in self.__queue or key in self.__running
+
+    def is_full(self) -> bool:
+        """Returns True if no more jobs can be queued."""
+        with self.__condition:
+            return len(self.__queue) >= self.max_queued_jobs
+
+    def get_queue_position(self, key: Hashable) -> int | None:
+        """
+        Gets position of job with `key`.
+
+        Args:
+            key (Hashable): Identifies the job.
+
+        Returns:
+            int | None: 0 if the job is running, 1 if it runs next and so on. None if it isn't scheduled.
+        """
+        with self.__condition:
+            if key in self.__running:
+                return 0
+            for position, queued_key in enumerate(self.__queue, start=1):
+                if queued_key == key:
+                    return position
+            return None
+
+    def __start_workers(self) -> None:
+        """Starts worker threads on first submit. Must be called while holding the condition."""
+        while len(self.__workers) < self.max_concurrent_jobs:
+            worker = Thread(target=self.__run_worker, daemon=True)
+            self.__workers.append(worker)
+            worker.start()
+
+    def __run_worker(self) -> None:
+        """Runs queued jobs in order forever."""
+        while True:
+            with self.__condition:
+                while len(self.__queue) == 0:
+                    self.__condition.wait()
+                keys, jobs = [], []
+                while len(self.__queue) > 0 and len(jobs) < self.max_batch_size:
+                    key, job = self.__queue.popitem(last=False)
+                    keys.append(key)
+                    jobs.append(job)
+                self.__running.update(keys)
+            self.__notify_queue_changed()
+            try:
+                self.__run_jobs(jobs)
+            except Exception:
+                # a failed batch must not stop the worker, the next jobs still run
+                logger.exception('Training jobs %s failed', keys)
+            finally:
+                with self.__condition:
+                    self.__running.difference_update(keys)
+
+    def __notify_queue_changed(self) -> None:
+        if self.__on_queue_changed is not None:
+            self.__on_queue_changed()
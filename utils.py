@@ -5,12 +5,22 @@ import pandas as pd
 
 BOOKS_DATA = Path('books_data')
 BOOKS_DATA_MODEL = BOOKS_DATA / 'model_adagrad_200.pkl'
+BOOKS_DATA_MODEL_ARRAYS = BOOKS_DATA / 'model_adagrad_200'
+BOOKS_DATA_MODEL_DELTAS = BOOKS_DATA / 'model_adagrad_200_deltas'
+BOOKS_DATA_ITEM_NEIGHBORS = BOOKS_DATA / 'item_neighbors.npy'
+BOOKS_DATA_ITEM_NEIGHBORS_TMP = BOOKS_DATA / 'item_neighbors.tmp.npy'
+# normalized item representations the neighbors table was computed for
+BOOKS_DATA_ITEM_NEIGHBORS_VECTORS = BOOKS_DATA / 'item_neighbors_vectors.npy'
+BOOKS_DATA_ITEM_NEIGHBORS_VECTORS_TMP = BOOKS_DATA / 'item_neighbors_vectors.tmp.npy'
 BOOKS_DATA_ITEM_FEATURES = BOOKS_DATA / 'item_features.npz'
 BOOKS_DATA_USER_FEATURES = BOOKS_DATA / 'user_features.npz'
+# id of each user added after user_features.npz was saved, in order, these users only have a unique feature
+BOOKS_DATA_USER_FEATURES_LOG = BOOKS_DATA / 'user_features_added_ids.log'
 BOOKS_DATA_BOOKS_PROCESSED = BOOKS_DATA / 'books_processed.csv'
 BOOKS_DATA_Y = BOOKS_DATA / 'y.npz'
 BOOKS_DATA_NEGATIVE_RATINGS = BOOKS_DATA / 'negative_ratings.npz'
 BOOKS_DATA_IMAGES = BOOKS_DATA / 'images'
+BOOKS_DATA_IMAGE_VARIANTS = BOOKS_DATA / 'image_variants'
 BOOKS_AUTHORS = BOOKS_DATA / 'book_authors.csv'
 BOOKS_CATEGORIES = BOOKS_DATA / 'categories.csv'
 BOOKS_DATA_USER_PREPROCESSING = BOOKS_DATA / 'user_processing.pkl'
@@ -48,4 +58,22 @@ def process_book_scraped_url(url : str) -> str:
     """
     if type(url) is str:
         return url.replace(__base_url, '').replace('/', '-')
-    return url
\ No newline at end of file
+    return url
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Gets the indices of the `k` largest values of `scores` sorted descending, using argpartition instead of a full sort.
+
+    Args:
+        scores (np.ndarray): Single dimensional array.
+        k (int): Number of indices to take.
+
+    Returns:
+        np.ndarray: Single dimensional array with at most `k` indices.
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
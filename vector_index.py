@@ -0,0 +1,366 @@
+from concurrent.futures import ThreadPoolExecutor
+import copy
+from pathlib import Path
+import numpy as np
+
+
+def normalize_rows(X: np.ndarray) -> np.ndarray:
+    """
+    Divides each row of `X` by its L2 norm, rows with norm 0 are left as 0.
+
+    Args:
+        X (np.ndarray): Two dimensional array.
+
+    Returns:
+        np.ndarray: Two dimensional float32 array.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return X / norms
+
+
+def find_drifted_vectors(vectors: np.ndarray, X: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Finds rows of `X` whose cosine distance to the row of `vectors` with the same index is higher than `threshold`.
+
+    Args:
+        vectors (np.ndarray): Two dimensional array of normalized rows.
+        X (np.ndarray): Two dimensional array with the same shape as `vectors`.
+        threshold (float): Cosine distance, from 0 to 2.
+
+    Returns:
+        np.ndarray: Single dimensional array of row indices.
+    """
+    similarities = np.einsum('ij,ij->i', normalize_rows(X), vectors)
+    return np.flatnonzero(1 - similarities > threshold)
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Gets for each row of `scores` the column indices of the `k` largest values sorted descending.
+
+    Args:
+        scores (np.ndarray): Two dimensional array.
+        k (int): Number of indices to take from each row.
+
+    Returns:
+        np.ndarray: Two dimensional array of shape (rows, min(k, columns)).
+    """
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+
+class CosineIndex:
+    """Base class storing normalized vectors, subclasses implement fit, kneighbors and _on_update."""
+
+    def is_fitted(self) -> bool:
+        """Returns True if fit was called."""
+        return hasattr(self, 'vectors_')
+
+    def copy(self) -> "CosineIndex":
+        """Returns an independent copy, updating it doesn't change this index."""
+        return copy.deepcopy(self)
+
+    def find_drifted_rows(self, X: np.ndarray, threshold: float) -> np.ndarray:
+        """
+        Finds rows of `X` whose cosine distance to the indexed vector with the same index is higher than `threshold`.
+
+        Args:
+            X (np.ndarray): Two dimensional array with the same shape as the fitted array.
+            threshold (float): Cosine distance, from 0 to 2.
+
+        Returns:
+            np.ndarray: Single dimensional array of row indices.
+        """
+        return find_drifted_vectors(self.vectors_, X, threshold)
+
+    def update(self, rows: np.ndarray, X_rows: np.ndarray) -> None:
+        """
+        Replaces indexed vectors at `rows` in place without rebuilding the index.
+
+        Args:
+            rows (np.ndarray): Single dimensional array of row indices.
+            X_rows (np.ndarray): Two dimensional array, new value of each row in `rows`.
+
+        Returns:
+            None.
+        """
+        self.vectors_[rows] = normalize_rows(X_rows)
+        self._on_update(rows)
+
+    def _on_update(self, rows: np.ndarray) -> None:
+        """Called after `rows` vectors were replaced."""
+
+
+class ExactCosineIndex(CosineIndex):
+    """
+    Exact cosine nearest neighbors, vectors are normalized once at fit so a search is a single matrix product
+    followed by argpartition. Returns the same neighbors as NearestNeighbors(metric='cosine').
+    """
+
+    # number of queries scored at once, bounds memory to QUERY_BATCH_SIZE * number of vectors scores
+    QUERY_BATCH_SIZE = 64
+
+    def __init__(self, n_neighbors: int = 30):
+        self.n_neighbors = n_neighbors
+
+    def fit(self, X: np.ndarray) -> "ExactCosineIndex":
+        """
+        Stores normalized rows of `X`.
+
+        Args:
+            X (np.ndarray): Two dimensional array, one row for each item.
+
+        Returns:
+            ExactCosineIndex: self.
+        """
+        self.vectors_ = normalize_rows(X)
+        return self
+
+    def kneighbors(self, X: np.ndarray, n_neighbors: int | None = None) -> np.ndarray:
+        """
+        Gets the indices of the nearest neighbors of each row in `X`.
+
+        Args:
+            X (np.ndarray): Two dimensional array, one row for each query.
+            n_neighbors (int | None): Number of neighbors, `self.n_neighbors` if None.
+
+        Returns:
+            np.ndarray (two dimensional array): Row i contains the indices of the nearest neighbors of query i, closest first.
+        """
+        n_neighbors = self.n_neighbors if n_neighbors is None else n_neighbors
+        queries = normalize_rows(X)
+        results = []
+        for start in range(0, queries.shape[0], ExactCosineIndex.QUERY_BATCH_SIZE):
+            scores = queries[start:start + ExactCosineIndex.QUERY_BATCH_SIZE] @ self.vectors_.T
+            results.append(top_k_rows(scores, n_neighbors))
+        return np.concatenate(results, axis=0)
+
+
+class IvfCosineIndex(CosineIndex):
+    """
+    Approximate cosine nearest neighbors using an inverted file. Vectors are partitioned with spherical k-means
+    into `n_lists` lists and a search only scores vectors from the `n_probe` lists closest to the query.
+    Higher `n_probe` gives higher recall and slower searches, `n_probe = n_lists` is an exact search.
+    """
+
+    def __init__(self, n_neighbors: int = 30, n_lists: int = 256, n_probe: int = 8,
+                 n_iterations: int = 10, max_training_size: int = 50_000, random_state: int = 0):
+        self.n_neighbors = n_neighbors
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iterations = n_iterations
+        self.max_training_size = max_training_size
+        self.random_state = random_state
+
+    def fit(self, X: np.ndarray) -> "IvfCosineIndex":
+        """
+        Trains centroids on a sample of normalized rows of `X` and assigns every row to its closest centroid.
+
+        Args:
+            X (np.ndarray): Two dimensional array, one row for each item.
+
+        Returns:
+            IvfCosineIndex: self.
+        """
+        self.vectors_ = normalize_rows(X)
+        self.centroids_ = self.__train_centroids(self.vectors_)
+        self.assignments_ = self.__assign(self.vectors_)
+        self.__build_lists()
+        return self
+
+    def kneighbors(self, X: np.ndarray, n_neighbors: int | None = None) -> np.ndarray:
+        """
+        Gets the indices of the approximate nearest neighbors of each row in `X`.
+
+        Args:
+            X (np.ndarray): Two dimensional array, one row for each query.
+            n_neighbors (int | None): Number of neighbors, `self.n_neighbors` if None.
+
+        Returns:
+            np.ndarray (two dimensional array): Row i contains the indices of the nearest neighbors of query i, closest first.
+            If probed lists have less vectors than `n_neighbors`, missing neighbors are -1.
+        """
+        n_neighbors = self.n_neighbors if n_neighbors is None else n_neighbors
+        queries = normalize_rows(X)
+        n_probe = min(self.n_probe, self.centroids_.shape[0])
+        probed_lists = top_k_rows(queries @ self.centroids_.T, n_probe)
+        results = np.full((queries.shape[0], n_neighbors), -1, dtype=np.intp)
+        for i, lists in enumerate(probed_lists):
+            candidates = np.concatenate(
+                [self.order_[self.offsets_[l]:self.offsets_[l + 1]] for l in lists])
+            if candidates.shape[0] == 0:
+                continue
+            scores = self.vectors_[candidates] @ queries[i]
+            top = top_k_rows(scores.reshape(1, -1), n_neighbors)[0]
+            results[i, :top.shape[0]] = candidates[top]
+        return results
+
+    def _on_update(self, rows: np.ndarray) -> None:
+        """Moves updated vectors to the list of their closest centroid, centroids are not retrained."""
+        self.assignments_[rows] = self.__assign(self.vectors_[rows])
+        self.__build_lists()
+
+    def __train_centroids(self, vectors: np.ndarray) -> np.ndarray:
+        """Spherical k-means on a random sample of `vectors`."""
+        random_state = np.random.RandomState(self.random_state)
+        nr_samples = min(vectors.shape[0], self.max_training_size)
+        sample = vectors[random_state.choice(
+            vectors.shape[0], nr_samples, replace=False)]
+        nr_lists = min(self.n_lists, nr_samples)
+        centroids = sample[random_state.choice(
+            nr_samples, nr_lists, replace=False)]
+        for _ in range(self.n_iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            # lists without vectors keep their previous centroid
+            empty = np.bincount(labels, minlength=nr_lists) == 0
+            sums[empty] = centroids[empty]
+            centroids = normalize_rows(sums)
+        return centroids
+
+    def __assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Gets index of closest centroid for each row of `vectors`."""
+        assignments = np.empty(vectors.shape[0], dtype=np.intp)
+        batch_size = 4096
+        for start in range(0, vectors.shape[0], batch_size):
+            batch = vectors[start:start + batch_size]
+            assignments[start:start + batch_size] = np.argmax(
+                batch @ self.centroids_.T, axis=1)
+        return assignments
+
+    def __build_lists(self) -> None:
+        """Sorts vector indices by list so list l is order_[offsets_[l]:offsets_[l + 1]]."""
+        self.order_ = np.argsort(self.assignments_, kind='stable')
+        counts = np.bincount(self.assignments_,
+                             minlength=self.centroids_.shape[0])
+        self.offsets_ = np.concatenate([[0], np.cumsum(counts)])
+
+
+def _compute_table_rows(vectors: np.ndarray, rows: np.ndarray, n_neighbors: int) -> np.ndarray:
+    """Gets exact neighbors of `rows` among all `vectors`, scored with a matrix product."""
+    return top_k_rows(vectors[rows] @ vectors.T, n_neighbors).astype(np.int32)
+
+
+def _update_table_rows(vectors: np.ndarray, previous_vectors: np.ndarray, previous_table: np.ndarray,
+                       changed_rows: np.ndarray, is_changed: np.ndarray, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Gets neighbors of unchanged `rows` by scoring only their previous neighbors and the changed rows.
+    Rows that weren't changed keep their score with every other unchanged row, therefore a row whose previous neighbors
+    are all unchanged is exact. Otherwise it is exact only if its new k-th score isn't lower than its previous one,
+    because rows outside the candidates scored at most the previous k-th score.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Neighbors of each row and, for each row, True if they are exact.
+    """
+    queries = vectors[rows]
+    neighbors = previous_table[rows]
+    neighbor_scores = np.einsum('ij,ikj->ik', queries, vectors[neighbors])
+    has_changed_neighbors = is_changed[neighbors]
+    # changed neighbors are scored with the changed rows, a single candidate for each of them
+    neighbor_scores[has_changed_neighbors] = -np.inf
+    candidates = np.concatenate([neighbors, np.broadcast_to(changed_rows, (rows.shape[0], changed_rows.shape[0]))], axis=1)
+    scores = np.concatenate([neighbor_scores, queries @ vectors[changed_rows].T], axis=1)
+    top = top_k_rows(scores, neighbors.shape[1])
+    kth_scores = np.take_along_axis(scores, top[:, -1:], axis=1)[:, 0]
+    previous_kth_scores = np.einsum('ij,ij->i', queries, previous_vectors[neighbors[:, -1]])
+    is_exact = ~has_changed_neighbors.any(axis=1) | (kth_scores >= previous_kth_scores)
+    return np.take_along_axis(candidates, top, axis=1).astype(np.int32), is_exact
+
+
+def _write_table_rows(table: np.ndarray, vectors: np.ndarray, rows: np.ndarray, n_neighbors: int,
+                      max_workers: int, max_chunk_scores: int) -> None:
+    """Computes exact neighbors of `rows` in chunks across a thread pool and writes them to `table`."""
+    chunk_size = max(1, max_chunk_scores // vectors.shape[0])
+    chunks = [rows[start:start + chunk_size] for start in range(0, rows.shape[0], chunk_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk, neighbors in zip(chunks, executor.map(lambda chunk: _compute_table_rows(vectors, chunk, n_neighbors), chunks)):
+            table[chunk] = neighbors
+
+
+def compute_neighbor_table(X: np.ndarray, n_neighbors: int, output_path: str | Path,
+                           max_workers: int, max_chunk_scores: int = 2 ** 24) -> np.ndarray:
+    """
+    Computes exact cosine nearest neighbors of every row of `X` and writes them to `output_path` as a
+    (rows, n_neighbors) int32 .npy file. Rows are split in chunks scored with a matrix product across a thread pool,
+    matrix products and sorts release the GIL, therefore threads run in parallel without copying `X` to other processes.
+
+    Args:
+        X (np.ndarray): Two dimensional array, one row for each item.
+        n_neighbors (int): Number of neighbors of each item, the item itself is included.
+        output_path (str | Path): Path of the .npy file, it is overwritten.
+        max_workers (int): Number of threads.
+        max_chunk_scores (int): Maximum number of scores computed at once by a thread, bounds its memory.
+
+    Returns:
+        np.ndarray: Normalized rows of `X` the table was computed for, see update_neighbor_table.
+    """
+    vectors = normalize_rows(X)
+    nr_rows = vectors.shape[0]
+    n_neighbors = min(n_neighbors, nr_rows)
+    table = np.lib.format.open_memmap(
+        output_path, mode='w+', dtype=np.int32, shape=(nr_rows, n_neighbors))
+    _write_table_rows(table, vectors, np.arange(nr_rows), n_neighbors, max_workers, max_chunk_scores)
+    table.flush()
+    del table
+    return vectors
+
+
+def update_neighbor_table(X: np.ndarray, previous_vectors: np.ndarray, previous_table: np.ndarray, output_path: str | Path,
+                          max_workers: int, drift_threshold: float, max_updated_fraction: float,
+                          max_chunk_scores: int = 2 ** 24) -> np.ndarray:
+    """
+    Writes the neighbor table of `X` to `output_path` from `previous_table`, computed for `previous_vectors`, by scoring
+    again only rows of `X` that drifted more than `drift_threshold` cosine distance. Neighbors of drifted rows are computed
+    against all rows, other rows only score their previous neighbors and the drifted rows, and are computed against all rows
+    only if a drifted row left their neighbors. Rows that didn't drift keep their previous vector, like CosineIndex.update.
+    Computes the whole table with compute_neighbor_table if more than `max_updated_fraction` of the rows drifted or
+    the number of rows changed. The table keeps the number of neighbors of `previous_table`.
+
+    Args:
+        X (np.ndarray): Two dimensional array, one row for each item.
+        previous_vectors (np.ndarray): Vectors returned when `previous_table` was written, not modified.
+        previous_table (np.ndarray): Two dimensional int32 array, neighbors of each row of `previous_vectors`.
+        output_path (str | Path): Path of the .npy file, it is overwritten, must not be the file of `previous_table`.
+        max_workers (int): Number of threads.
+        drift_threshold (float): Cosine distance, from 0 to 2.
+        max_updated_fraction (float): Fraction of the rows above which the whole table is computed.
+        max_chunk_scores (int): Maximum number of scores computed at once by a thread, bounds its memory.
+
+    Returns:
+        np.ndarray: Normalized vectors the new table was computed for.
+    """
+    n_neighbors = previous_table.shape[1]
+    if previous_vectors.shape != X.shape or previous_table.shape[0] != X.shape[0]:
+        return compute_neighbor_table(X, n_neighbors, output_path, max_workers, max_chunk_scores)
+    changed_rows = find_drifted_vectors(previous_vectors, X, drift_threshold)
+    if changed_rows.shape[0] > max_updated_fraction * X.shape[0]:
+        return compute_neighbor_table(X, n_neighbors, output_path, max_workers, max_chunk_scores)
+
+    vectors = np.array(previous_vectors)
+    vectors[changed_rows] = normalize_rows(X[changed_rows])
+    is_changed = np.zeros(vectors.shape[0], dtype=bool)
+    is_changed[changed_rows] = True
+    table = np.lib.format.open_memmap(
+        output_path, mode='w+', dtype=np.int32, shape=previous_table.shape)
+    table[:] = previous_table
+    if changed_rows.shape[0] > 0:
+        unchanged_rows = np.flatnonzero(~is_changed)
+        chunk_size = max(1, max_chunk_scores // (n_neighbors + changed_rows.shape[0]))
+        chunks = [unchanged_rows[start:start + chunk_size] for start in range(0, unchanged_rows.shape[0], chunk_size)]
+        inexact_rows = [changed_rows]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda chunk: _update_table_rows(
+                vectors, previous_vectors, previous_table, changed_rows, is_changed, chunk), chunks)
+            for chunk, (neighbors, is_exact) in zip(chunks, results):
+                table[chunk] = neighbors
+                inexact_rows.append(chunk[~is_exact])
+        _write_table_rows(table, vectors, np.concatenate(inexact_rows), n_neighbors, max_workers, max_chunk_scores)
+    table.flush()
+    del table
+    return vectors